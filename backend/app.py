@@ -1,15 +1,49 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response
+from flask.json.provider import JSONProvider
 from flask_cors import CORS
-from music21 import stream, note, key, roman, pitch, interval, scale, chord
+from music21 import stream, note, key, roman, pitch, chord
 import os
-from itertools import combinations, product
-import copy
+from operator import itemgetter
+import base64
+from concurrent.futures import ProcessPoolExecutor
+import functools
+import hashlib
+import heapq
+import hmac
+import httpx
 import itertools
+import json
+import multiprocessing
+import tempfile
+import threading
+import time
+import unicodedata
+import numpy as np
+import orjson
 import replicate
 
+class OrjsonProvider(JSONProvider):
+    """Serializes jsonify responses and parses request bodies with orjson."""
+    option = orjson.OPT_NON_STR_KEYS
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, option=self.option).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        # Write the bytes straight into the response rather than via a str
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(orjson.dumps(obj, option=self.option), mimetype='application/json')
+
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
 CORS(app)  # Allow cross-origin requests from your frontend
 
+# Characters that mark a note name as already carrying an octave
+DIGITS = frozenset('0123456789')
+
 @app.route('/analyze_bassline', methods=['POST'])
 def analyze_bassline():
     try:
@@ -24,7 +58,7 @@ def analyze_bassline():
         bass_stream = stream.Stream()
         for note_name in bass_notes:
             # Handle octave if not provided
-            if not any(char.isdigit() for char in note_name):
+            if DIGITS.isdisjoint(note_name):
                 note_name += '3'  # Default to octave 3 for bass
             n = note.Note(note_name)
             bass_stream.append(n)
@@ -62,11 +96,77 @@ def analyze_bassline():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-def detect_key_from_bass(bass_stream):
-    """Detect the most likely key from the bass line using Music21's analysis."""
+# Scale templates for the fast key finder: row t is the scale on pitch class t,
+# first the 12 major keys, then the 12 minor keys (harmonic minor, so the raised
+# leading tone separates a minor key from its relative major)
+MAJOR_SCALE_MASK = np.array([1, 0, 1, 0, 1, 1, 0, 1, 0, 1, 0, 1])
+HARMONIC_MINOR_MASK = np.array([1, 0, 1, 1, 0, 1, 0, 1, 1, 0, 0, 1])
+KEY_TEMPLATES = np.array(
+    [np.roll(MAJOR_SCALE_MASK, t) for t in range(12)] +
+    [np.roll(HARMONIC_MINOR_MASK, t) for t in range(12)]
+)
+MAJOR_TONIC_NAMES = ['C', 'D-', 'D', 'E-', 'E', 'F', 'F#', 'G', 'A-', 'A', 'B-', 'B']
+MINOR_TONIC_NAMES = ['C', 'C#', 'D', 'E-', 'E', 'F', 'F#', 'G', 'G#', 'A', 'B-', 'B']
+
+def find_key_from_histogram(bass_stream):
+    """Pick the key whose scale covers the most bass notes, preferring the most frequent tonic."""
+    histogram = np.bincount([n.pitch.pitchClass for n in bass_stream.notes], minlength=12)
+    # Scale fit dominates; the tonic's own count only breaks ties between keys that fit equally
+    tonic_weight = np.tile(histogram, 2) / (histogram.sum() + 1)
+    best = int(np.argmax(KEY_TEMPLATES @ histogram + tonic_weight))
+    if best < 12:
+        return key.Key(MAJOR_TONIC_NAMES[best], 'major')
+    return key.Key(MINOR_TONIC_NAMES[best - 12], 'minor')
+
+# Scale data for each key, built once so per-note and per-voicing code can look
+# it up instead of asking music21 again. Keys with other tonic spellings are
+# added on first use.
+KEY_TABLES = {}
+
+def _build_key_table(tonic, mode):
+    key_obj = key.Key(tonic, mode)
+    pitches = key_obj.getPitches()
+    leading_tone = key_obj.getLeadingTone()
+    return {
+        'scale_pitch_names': tuple(p.name for p in pitches),
+        'degree_by_name': {p.name: degree for degree, p in enumerate(pitches[:7], start=1)},
+        'leading_tone': leading_tone.name,
+        'leading_tone_pc': leading_tone.pitchClass
+    }
+
+def _build_key_tables():
+    for tonic in MAJOR_TONIC_NAMES:
+        KEY_TABLES[(tonic, 'major')] = _build_key_table(tonic, 'major')
+    for tonic in MINOR_TONIC_NAMES:
+        KEY_TABLES[(tonic, 'minor')] = _build_key_table(tonic, 'minor')
+
+def key_table(key_obj):
+    """Return the precomputed scale data for a music21 key."""
+    table_key = (key_obj.tonic.name, key_obj.mode)
+    table = KEY_TABLES.get(table_key)
+    if table is None:
+        table = KEY_TABLES[table_key] = _build_key_table(*table_key)
+    return table
+
+_build_key_tables()
+
+@functools.lru_cache(maxsize=64)
+def _key_for(tonic, mode):
+    """Shared music21 Key for a tonic and mode; callers only read it."""
+    return key.Key(tonic, mode)
+
+def detect_key_from_bass(bass_stream, use_fast_key=True):
+    """Detect the most likely key from the bass line.
+    
+    Uses a pitch-class histogram by default; pass use_fast_key=False to use
+    Music21's (much slower) Krumhansl key analysis instead.
+    """
     try:
-        # Use Music21's key detection algorithm
-        detected_key = bass_stream.analyze('key')
+        if use_fast_key:
+            detected_key = find_key_from_histogram(bass_stream)
+        else:
+            # Use Music21's key detection algorithm
+            detected_key = bass_stream.analyze('key')
         
         # If detection fails or gives unusual result, default to C major/A minor
         if detected_key is None or detected_key.name not in ['C major', 'G major', 'F major', 'D major', 'A major', 'E major', 'B- major', 'A minor', 'E minor', 'B minor', 'D minor', 'F# minor']:
@@ -81,7 +181,7 @@ def detect_key_from_bass(bass_stream):
             else:
                 detected_key = key.Key('C', 'major')  # Default fallback
                 
-    except:
+    except Exception:
         detected_key = key.Key('C', 'major')  # Safe fallback
     
     return detected_key
@@ -93,34 +193,29 @@ def generate_progression_options(bass_stream, detected_key):
     # Generate progressions that actually match the bass line
     progressions = generate_bass_specific_progressions(bass_notes, detected_key)
     
-    # Score and sort progressions
-    scored_progressions = []
-    for prog in progressions:
-        score = score_progression(prog, bass_notes, detected_key)
-        scored_progressions.append({
-            'roman_numerals': prog,
-            'score': score,
-            'style': get_progression_style(prog),
-            'description': get_progression_description(prog, detected_key)
-        })
+    # Score progressions and keep the top 5; only those need a style and description
+    scored = [(score_progression(prog, bass_notes, detected_key), prog) for prog in progressions]
+    top_progressions = heapq.nlargest(5, scored, key=lambda x: x[0])
     
-    # Sort by score and return top 5
-    scored_progressions.sort(key=lambda x: x['score'], reverse=True)
-    return scored_progressions[:5]
+    return [{
+        'roman_numerals': prog,
+        'score': score,
+        'style': get_progression_style(prog),
+        'description': get_progression_description(prog, detected_key)
+    } for score, prog in top_progressions]
 
 def generate_bass_specific_progressions(bass_notes, detected_key):
     """Generate progressions that actually fit the given bass notes."""
     progressions = []
+    # One key table lookup for the whole line, not one per bass note
+    degree_by_name = key_table(detected_key)['degree_by_name']
     
     # For each bass note, find all possible chords where it can function as bass
     bass_chord_options = []
     for i, bass_note in enumerate(bass_notes):
-        possible_chords = get_chords_for_bass_note(bass_note, detected_key, i, len(bass_notes))
+        possible_chords = get_chords_for_bass_note(bass_note, detected_key, i, len(bass_notes), degree_by_name)
         bass_chord_options.append(possible_chords)
     
-    # Generate multiple progression combinations
-    from itertools import product
-    
     # Smart limitation based on bass line length
     max_combinations = min(100, 4 ** min(len(bass_chord_options), 6))  # More combinations for shorter lines
     options_per_note = max(2, 8 // len(bass_chord_options)) if len(bass_chord_options) > 0 else 3
@@ -128,120 +223,141 @@ def generate_bass_specific_progressions(bass_notes, detected_key):
     # Limit options per bass note to keep combinations manageable
     limited_options = [options[:options_per_note] for options in bass_chord_options]
     
-    # Generate all combinations up to the limit
+    # Build progressions one bass note at a time, keeping the best-scoring
+    # max_combinations prefixes instead of enumerating every combination
     if limited_options:
-        all_combinations = list(product(*limited_options))
-        for combination in all_combinations[:max_combinations]:
-            progressions.append(list(combination))
+        total_length = len(limited_options)
+        beam = [((), 0)]
+        for position, options in enumerate(limited_options):
+            # Stream the extensions through a bounded heap rather than building the full list
+            candidates = enumerate(
+                (prefix + (chord_name,), partial + progression_step_score(prefix, chord_name, position, total_length))
+                for prefix, partial in beam
+                for chord_name in options
+            )
+            best = heapq.nlargest(max_combinations, candidates, key=lambda c: c[1][1])
+            # Keep survivors in enumeration order so ties break the same way as before
+            beam = [c for _, c in sorted(best, key=itemgetter(0))]
+        progressions = [list(prefix) for prefix, _ in beam]
     
     return progressions
 
-def get_chords_for_bass_note(bass_note, detected_key, position, total_length):
-    """Get chords where the given bass note can logically function as the bass."""
-    bass_pitch = bass_note.pitch
-    try:
-        scale_degree = detected_key.getScaleDegreeFromPitch(bass_pitch)
-    except:
-        # Fallback calculation
-        tonic_pitch = detected_key.tonic
-        interval_from_tonic = interval.Interval(tonic_pitch, bass_note.pitch)
-        scale_degree = ((interval_from_tonic.semitones % 12) // 1) + 1
+def progression_step_score(prefix, chord_name, position, total_length):
+    """Score contributed by appending chord_name to prefix.
     
-    possible_chords = []
+    Covers the per-chord and per-transition terms of score_progression so
+    partial progressions can be ranked; the unique-chord penalty depends on
+    the whole progression and is applied when the finished ones are scored.
+    """
+    score = 0
+    if prefix:
+        score += TRANSITION_SCORES.get((prefix[-1], chord_name), 0)
+    if position == 0 and chord_name in ['I', 'i']:
+        score += 15
+    if position == total_length - 1:
+        if chord_name in ['I', 'i']:
+            score += 25
+            if prefix and prefix[-1] in ['V', 'V7']:
+                score += 30
+            elif prefix and prefix[-1] in ['IV']:
+                score += 20
+    if 'iii' in chord_name or 'III' in chord_name:
+        score -= 30
+    return score
+
+# Chords that can have each scale degree in the bass
+MAJOR_BASS_CHORD_OPTIONS = {
+    1: ('I', 'vi6'),  # 1st degree: I (root), vi6 (3rd of vi)
+    2: ('ii', 'vii°6', 'V7'),  # 2nd degree: ii (root), vii°6 (3rd), V7 (5th)
+    3: ('I6',),  # 3rd degree: I6 (3rd of I) - avoid iii
+    4: ('IV', 'ii6', 'I6/4'),  # 4th degree: IV (root), ii6 (3rd), I6/4 (5th of I)
+    5: ('V', 'V7', 'I6/4'),  # 5th degree: V (root) - avoid iii6
+    6: ('vi', 'IV6'),  # 6th degree: vi (root), IV6 (3rd of IV)
+    7: ('vii°', 'V7', 'V6/5')  # 7th degree: vii° (root), V7 (3rd)
+}
+MINOR_BASS_CHORD_OPTIONS = {
+    1: ('i', 'VI6'),
+    2: ('ii°', 'vii°6', 'V7'),
+    3: ('i6',),  # 3rd degree: i6 (3rd of i) - avoid III
+    4: ('iv', 'ii°6', 'i6/4'),
+    5: ('V', 'v'),  # 5th degree: V, v - avoid III6
+    6: ('VI', 'iv6'),
+    7: ('vii°', 'V7')
+}
+BASS_CHORD_OPTIONS = {'major': MAJOR_BASS_CHORD_OPTIONS, 'minor': MINOR_BASS_CHORD_OPTIONS}
+DEFAULT_CHORD_OPTIONS = {'major': ('I',), 'minor': ('i',)}
+
+# Position-specific choices that replace the options above
+FIRST_CHORD_OPTIONS = {  # First chord - prefer stable chords
+    'major': {1: ('I',), 5: ('V', 'V7')},
+    'minor': {1: ('i',), 5: ('V', 'V7')}
+}
+LAST_CHORD_OPTIONS = {  # Last chord - prefer tonic
+    'major': {1: ('I',), 5: ('V7',)},  # V7 leads to the implied tonic
+    'minor': {1: ('i',), 5: ('V7',)}
+}
+
+def get_chords_for_bass_note(bass_note, detected_key, position, total_length, degree_by_name=None):
+    """Get chords where the given bass note can logically function as the bass."""
+    if degree_by_name is None:
+        degree_by_name = key_table(detected_key)['degree_by_name']
+    # Scale degree by pitch name, as Key.getScaleDegreeFromPitch does (None if not in the scale)
+    scale_degree = degree_by_name.get(bass_note.pitch.name)
+    mode = 'major' if detected_key.mode == 'major' else 'minor'
     
     # Based on scale degree, determine what chords can have this note in the bass
-    if detected_key.mode == 'major':
-        chord_options = {
-            1: ['I', 'vi6'],  # 1st degree: I (root), vi6 (3rd of vi)
-            2: ['ii', 'vii°6', 'V7'],  # 2nd degree: ii (root), vii°6 (3rd), V7 (5th)
-            3: ['I6'],  # 3rd degree: I6 (3rd of I) - avoid iii
-            4: ['IV', 'ii6', 'I6/4'],  # 4th degree: IV (root), ii6 (3rd), I6/4 (5th of I)
-            5: ['V', 'V7', 'I6/4'],  # 5th degree: V (root) - avoid iii6
-            6: ['vi', 'IV6'],  # 6th degree: vi (root), IV6 (3rd of IV)
-            7: ['vii°', 'V7', 'V6/5']  # 7th degree: vii° (root), V7 (3rd)
-        }
-    else:  # minor mode
-        chord_options = {
-            1: ['i', 'VI6'],
-            2: ['ii°', 'vii°6', 'V7'],
-            3: ['i6'],  # 3rd degree: i6 (3rd of i) - avoid III
-            4: ['iv', 'ii°6', 'i6/4'],
-            5: ['V', 'v'],  # 5th degree: V, v - avoid III6
-            6: ['VI', 'iv6'],
-            7: ['vii°', 'V7']
-        }
-    
-    # Get the basic options for this scale degree
-    if scale_degree in chord_options:
-        possible_chords = chord_options[scale_degree][:]
-    else:
-        possible_chords = ['I'] if detected_key.mode == 'major' else ['i']
+    possible_chords = BASS_CHORD_OPTIONS[mode].get(scale_degree, DEFAULT_CHORD_OPTIONS[mode])
     
     # Add position-specific logic
-    if position == 0:  # First chord - prefer stable chords
-        if scale_degree == 1:
-            possible_chords = ['I'] if detected_key.mode == 'major' else ['i']
-        elif scale_degree == 5:
-            possible_chords = ['V', 'V7']
-    elif position == total_length - 1:  # Last chord - prefer tonic
-        if scale_degree == 1:
-            possible_chords = ['I'] if detected_key.mode == 'major' else ['i']
-        elif scale_degree == 5:
-            possible_chords = ['V7']  # Leading to implied tonic
+    if position == 0:
+        possible_chords = FIRST_CHORD_OPTIONS[mode].get(scale_degree, possible_chords)
+    elif position == total_length - 1:
+        possible_chords = LAST_CHORD_OPTIONS[mode].get(scale_degree, possible_chords)
     
     return possible_chords[:3]  # Limit to top 3 options
 
+# Position-aware and general chord suggestions for get_contextual_chords
+CONTEXTUAL_FIRST_CHORDS = {1: ('I', 'I6'), 5: ('V', 'V7'), 6: ('vi', 'I6')}
+CONTEXTUAL_LAST_CHORDS = {1: ('I',), 5: ('V', 'V7')}
+CONTEXTUAL_CHORD_OPTIONS = {
+    1: ('I', 'I6', 'vi6'),
+    2: ('ii', 'ii6', 'V7', 'vii°6'),
+    3: ('iii', 'I6', 'vi'),
+    4: ('IV', 'ii6', 'I6/4'),
+    5: ('V', 'V7', 'iii6', 'I6/4'),
+    6: ('vi', 'IV6', 'I'),
+    7: ('vii°', 'V7', 'V6/5')
+}
+
 def get_contextual_chords(bass_note, detected_key, position, total_length):
     """Get possible chords for a bass note considering its position in the progression."""
-    try:
-        scale_degree = detected_key.getScaleDegreeFromPitch(bass_note.pitch)
-    except:
-        # Fallback calculation
-        tonic_pitch = detected_key.tonic
-        interval_from_tonic = interval.Interval(tonic_pitch, bass_note.pitch)
-        scale_degree = (interval_from_tonic.semitones % 12) + 1
-    
-    # Position-aware chord suggestions
-    if position == 0:  # First chord
-        if scale_degree == 1:
-            return ['I', 'I6']
-        elif scale_degree == 5:
-            return ['V', 'V7']
-        elif scale_degree == 6:
-            return ['vi', 'I6']
-    elif position == total_length - 1:  # Last chord
-        if scale_degree == 1:
-            return ['I']
-        elif scale_degree == 5:
-            return ['V', 'V7']
-    
-    # General chord mappings by scale degree
-    chord_mappings = {
-        1: ['I', 'I6', 'vi6'],
-        2: ['ii', 'ii6', 'V7', 'vii°6'],
-        3: ['iii', 'I6', 'vi'],
-        4: ['IV', 'ii6', 'I6/4'],
-        5: ['V', 'V7', 'iii6', 'I6/4'],
-        6: ['vi', 'IV6', 'I'],
-        7: ['vii°', 'V7', 'V6/5']
-    }
+    scale_degree = key_table(detected_key)['degree_by_name'].get(bass_note.pitch.name)
     
-    return chord_mappings.get(scale_degree, ['I'])
+    if position == 0 and scale_degree in CONTEXTUAL_FIRST_CHORDS:
+        return CONTEXTUAL_FIRST_CHORDS[scale_degree]
+    if position == total_length - 1 and scale_degree in CONTEXTUAL_LAST_CHORDS:
+        return CONTEXTUAL_LAST_CHORDS[scale_degree]
+    
+    return CONTEXTUAL_CHORD_OPTIONS.get(scale_degree, ('I',))
 
 def score_progression(progression, bass_notes, detected_key):
     """Score a progression based on music theory principles."""
     score = 100  # Start with perfect score
     
-    # Check for good voice leading patterns
-    for i in range(len(progression) - 1):
-        current_chord = progression[i]
-        next_chord = progression[i + 1]
+    # One pass over the chords for the transition, iii and repetition terms
+    seen = set()
+    prev_chord = None
+    for chord_name in progression:
+        # Reward common progressions, penalize weak ones
+        if prev_chord is not None:
+            score += TRANSITION_SCORES.get((prev_chord, chord_name), 0)
+        
+        # Heavy penalty for iii chords (rare and awkward in classical harmony)
+        if 'iii' in chord_name or 'III' in chord_name:
+            score -= 30  # Significant penalty for iii chords
         
-        # Reward common progressions
-        if is_strong_progression(current_chord, next_chord):
-            score += 20
-        elif is_weak_progression(current_chord, next_chord):
-            score -= 10
+        seen.add(chord_name)
+        prev_chord = chord_name
     
     # Check beginning and ending
     if progression[0] in ['I', 'i']:
@@ -249,14 +365,8 @@ def score_progression(progression, bass_notes, detected_key):
     if progression[-1] in ['I', 'i']:
         score += 25  # Very good to end on tonic
     
-    # Heavy penalty for iii chords (rare and awkward in classical harmony)
-    for chord in progression:
-        if 'iii' in chord or 'III' in chord:
-            score -= 30  # Significant penalty for iii chords
-    
     # Penalize too many repeated chords
-    unique_chords = len(set(progression))
-    if unique_chords < len(progression) * 0.6:
+    if len(seen) < len(progression) * 0.6:
         score -= 15
     
     # Reward proper cadences
@@ -268,27 +378,30 @@ def score_progression(progression, bass_notes, detected_key):
     
     return max(0, score)  # Don't go below 0
 
-def is_strong_progression(chord1, chord2):
-    """Check if this is a strong harmonic progression."""
-    strong_progressions = [
-        ('I', 'V'), ('I', 'V7'), ('I', 'vi'), ('I', 'IV'),
-        ('ii', 'V'), ('ii', 'V7'), ('ii7', 'V7'),
-        ('IV', 'V'), ('IV', 'V7'), ('IV', 'I'),
-        ('V', 'I'), ('V7', 'I'), ('V', 'vi'),
-        ('vi', 'IV'), ('vi', 'ii'), ('vi', 'V'),
-        ('iii', 'vi'), ('iii', 'IV')
-    ]
-    return (chord1, chord2) in strong_progressions
-
-def is_weak_progression(chord1, chord2):
-    """Check if this is a weak or awkward progression."""
-    weak_progressions = [
-        ('V', 'IV'), ('I', 'ii'), ('iii', 'ii'), 
-        ('vii°', 'vi'), ('V7', 'IV'), ('iii', 'IV'),
-        ('iii', 'V'), ('iii', 'vi'), ('I', 'iii'),
-        ('IV', 'iii'), ('vi', 'iii')  # Additional iii chord penalties
-    ]
-    return (chord1, chord2) in weak_progressions
+# Strong harmonic progressions
+STRONG_PROGRESSIONS = frozenset({
+    ('I', 'V'), ('I', 'V7'), ('I', 'vi'), ('I', 'IV'),
+    ('ii', 'V'), ('ii', 'V7'), ('ii7', 'V7'),
+    ('IV', 'V'), ('IV', 'V7'), ('IV', 'I'),
+    ('V', 'I'), ('V7', 'I'), ('V', 'vi'),
+    ('vi', 'IV'), ('vi', 'ii'), ('vi', 'V'),
+    ('iii', 'vi'), ('iii', 'IV')
+})
+
+# Weak or awkward progressions
+WEAK_PROGRESSIONS = frozenset({
+    ('V', 'IV'), ('I', 'ii'), ('iii', 'ii'), 
+    ('vii°', 'vi'), ('V7', 'IV'), ('iii', 'IV'),
+    ('iii', 'V'), ('iii', 'vi'), ('I', 'iii'),
+    ('IV', 'iii'), ('vi', 'iii')  # Additional iii chord penalties
+})
+
+# Score change for each listed transition, in one lookup. Strong wins where a
+# pair is listed as both (iii-IV, iii-vi).
+TRANSITION_SCORES = {
+    **dict.fromkeys(WEAK_PROGRESSIONS, -10),
+    **dict.fromkeys(STRONG_PROGRESSIONS, 20)
+}
 
 def get_progression_style(progression):
     """Determine the style of the progression."""
@@ -352,40 +465,86 @@ ALTO_RANGE = (pitch.Pitch("G3"), pitch.Pitch("C5"))
 TENOR_RANGE = (pitch.Pitch("C3"), pitch.Pitch("G4"))
 BASS_RANGE = (pitch.Pitch("E2"), pitch.Pitch("C4"))
 
+# The same ranges as (name, octave, midi) bounds for voicing enumeration
+SOPRANO_MIDI_RANGE, ALTO_MIDI_RANGE, TENOR_MIDI_RANGE, BASS_MIDI_RANGE = (
+    tuple((p.name, p.octave, p.midi) for p in pitchRange)
+    for pitchRange in (SOPRANO_RANGE, ALTO_RANGE, TENOR_RANGE, BASS_RANGE)
+)
+
+@functools.lru_cache(maxsize=None)
+def _pitchOffset(noteName):
+    """MIDI number of a note name in octave -1, e.g. 0 for C, 12 for B#."""
+    return int(pitch.Pitch(noteName, octave=-1).ps)
+
 def voiceNote(noteName, pitchRange):
-    """Generates voicings for a note in a given pitch range."""
-    lowerOctave = pitchRange[0].octave
-    upperOctave = pitchRange[1].octave
-    for octave in range(lowerOctave, upperOctave + 1):
-        n = pitch.Pitch(noteName + str(octave))
-        if pitchRange[0] <= n <= pitchRange[1]:
-            yield n
+    """Generates voicings for a note in a given pitch range.
+    
+    Bounds and voicings are (name, octave, midi) tuples. This keeps the
+    semantics of the Pitch-based original: only octaves from the lower
+    bound's to the upper bound's are tried, and a note sounding the same as
+    a bound is only inside it when spelled the same (music21's <= is < on
+    pitch space or ==, so B#4 is not <= C5).
+    """
+    lower, upper = pitchRange
+    offset = _pitchOffset(noteName)
+    for octave in range(lower[1], upper[1] + 1):
+        voiced = (noteName, octave, 12 * (octave + 1) + offset)
+        if inPitchRange(voiced, pitchRange):
+            yield voiced
+
+def inPitchRange(voiced, pitchRange):
+    """Whether a (name, octave, midi) note lies within (name, octave, midi) bounds, as music21's <= has it."""
+    lower, upper = pitchRange
+    return (lower[2] < voiced[2] or lower == voiced) and (voiced[2] < upper[2] or voiced == upper)
+
+def _octaveBelow(voicedNote):
+    name, octave, midi = voicedNote
+    return (name, octave - 1, midi - 12)
 
 def _voiceTriadUnordered(noteNames):
     assert len(noteNames) == 3
+    return _voiceTriadCached(tuple(noteNames))
+
+@functools.lru_cache(maxsize=128)
+def _voiceTriadCached(noteNames):
+    # The same three notes recur across chords and keys (I in C is VI in e).
+    # Voices are (name, octave, midi) tuples, tenor first.
+    triads = []
     for tenor, alto, soprano in itertools.permutations(noteNames, 3):
-        for sopranoNote in voiceNote(soprano, SOPRANO_RANGE):
-            altoMin = max((ALTO_RANGE[0], sopranoNote.transpose("-P8")))
-            altoMax = min((ALTO_RANGE[1], sopranoNote))
+        for sopranoNote in voiceNote(soprano, SOPRANO_MIDI_RANGE):
+            # Ties go to the first bound, as with music21's pitch comparisons
+            altoMin = max(ALTO_MIDI_RANGE[0], _octaveBelow(sopranoNote), key=itemgetter(2))
+            altoMax = min(ALTO_MIDI_RANGE[1], sopranoNote, key=itemgetter(2))
             for altoNote in voiceNote(alto, (altoMin, altoMax)):
-                tenorMin = max((TENOR_RANGE[0], altoNote.transpose("-P8")))
-                tenorMax = min((TENOR_RANGE[1], altoNote))
+                tenorMin = max(TENOR_MIDI_RANGE[0], _octaveBelow(altoNote), key=itemgetter(2))
+                tenorMax = min(TENOR_MIDI_RANGE[1], altoNote, key=itemgetter(2))
                 for tenorNote in voiceNote(tenor, (tenorMin, tenorMax)):
-                    yield chord.Chord([tenorNote, altoNote, sopranoNote])
+                    triads.append((tenorNote, altoNote, sopranoNote))
+    return tuple(triads)
 
 def _voiceChord(noteNames):
     assert len(noteNames) == 4
-    bass = noteNames.pop(0)
-    for chord_obj in _voiceTriadUnordered(noteNames):
-        for bassNote in voiceNote(bass, BASS_RANGE):
-            if bassNote <= chord_obj.bass():
-                chord4 = copy.deepcopy(chord_obj)
-                chord4.add(bassNote)
-                yield chord4
+    return _voiceChordCached(tuple(noteNames))
+
+@functools.lru_cache(maxsize=4096)
+def _voiceChordCached(noteNames):
+    # Keyed on the bass and the upper notes in order, which fixes the order of
+    # the voicings and so how ties in the DP resolve
+    bassNotes = list(voiceNote(noteNames[0], BASS_MIDI_RANGE))
+    return tuple(
+        (bassNote,) + triad
+        for triad in _voiceTriadUnordered(noteNames[1:])
+        for bassNote in bassNotes
+        if bassNote[2] < triad[0][2] or bassNote == triad[0]  # Pitch <=, see voiceNote
+    )
 
 def voiceChord(key_obj, chord_obj):
-    """Generates four-part voicings for a fifth or seventh chord."""
-    leadingTone = key_obj.getLeadingTone().name
+    """Generates four-part voicings for a fifth or seventh chord.
+    
+    Each voicing is a tuple of (name, octave, midi) per voice, bass to
+    soprano; see voicedNotes.
+    """
+    leadingTone = key_table(key_obj)['leading_tone']
     noteNames = [p.name for p in chord_obj.pitches]
     if chord_obj.containsSeventh():
         yield from _voiceChord(noteNames)
@@ -393,92 +552,173 @@ def voiceChord(key_obj, chord_obj):
         # must double the fifth
         yield from _voiceChord(noteNames + [chord_obj.fifth.name])
     else:
+        root, third, fifth = chord_obj.root(), chord_obj.third, chord_obj.fifth
         # Prioritize complete chords - double the root first (most stable)
-        if chord_obj.root().name != leadingTone:
-            yield from _voiceChord(noteNames + [chord_obj.root().name])
+        if root.name != leadingTone:
+            yield from _voiceChord(noteNames + [root.name])
         # double the fifth (good for stability)
-        if chord_obj.fifth and chord_obj.fifth.name != leadingTone:
-            yield from _voiceChord(noteNames + [chord_obj.fifth.name])
+        if fifth and fifth.name != leadingTone:
+            yield from _voiceChord(noteNames + [fifth.name])
         # double the third (less preferred, but acceptable)
-        if chord_obj.third.name != leadingTone:
-            yield from _voiceChord(noteNames + [chord_obj.third.name])
+        if third.name != leadingTone:
+            yield from _voiceChord(noteNames + [third.name])
         # REMOVED: option to omit the fifth - always use complete chords
 
-def progressionCost(key_obj, chord1, chord2):
-    """Computes elements of cost between two chords: contrary motion, etc."""
-    cost = 0
+# Voice index pairs (lower, upper) checked for parallel motion
+VOICE_PAIRS = list(itertools.combinations(range(4), 2))
+PAIR_LOWER, PAIR_UPPER = (np.array(voices) for voices in zip(*VOICE_PAIRS))
+
+# What the interval of a voice pair is to the parallel check: 0 other, 1 fifth,
+# 2 octave, 3 unison. PARALLEL_COST[4 * before + after] is the cost of moving
+# from one to the other: fifths 200, octaves 300, unisons 300 + 250
+PARALLEL_COST = np.zeros(16, dtype=np.int64)
+PARALLEL_COST[[4 * 1 + 1, 4 * 2 + 2, 4 * 2 + 3, 4 * 3 + 2, 4 * 3 + 3]] = [200, 300, 300, 300, 550]
+
+def pairIntervalClasses(midis):
+    """The parallel-check class of each voice pair of (K, 4) voicings, as (K, 6) int8."""
+    intervals = midis[:, PAIR_UPPER] - midis[:, PAIR_LOWER]
+    return np.select([intervals == 0, intervals % 12 == 0, intervals % 12 == 7], [3, 2, 1], 0).astype(np.int8)
+
+# A spelled note is told apart from its enharmonics by its letter, so 7 * midi + letter
+# identifies it; progressionCost compares these to tell which voices move
+LETTER_INDEX = {letter: i for i, letter in enumerate('CDEFGAB')}
+
+def voicedNotes(chord_obj):
+    """A four-note Chord as the (name, octave, midi) tuples voiceChord yields."""
+    return tuple((p.name, -1 if p.octave is None else p.octave, p.midi) for p in chord_obj.pitches)
+
+@functools.lru_cache(maxsize=4096)
+def _chordAnalysis(tonic, mode, noteNames):
+    """Chord cost, root name and seventh voice of a voicing given by note names.
+    
+    The only place a voicing becomes a music21 Chord; the same voicings come
+    back in every layer built for the key, so each is analysed once.
+    """
+    c = chord.Chord(list(noteNames))
+    return chordCost(_key_for(tonic, mode), c), c.root().name, c.pitches.index(c.seventh) if c.seventh else -1
+
+def voicingArrays(key_obj, voicings):
+    """Extracts the per-voicing data the DP needs into NumPy arrays.
+    
+    Chord analysis depends only on the pitch names, so it runs once per
+    distinct set of names; layers hold no music21 objects.
+    """
+    table = key_table(key_obj)
+    scaleNames = table['scale_pitch_names']
+    leadingTone = table['leading_tone']
+    dominantRoots = (scaleNames[4], leadingTone)
+    tonicRoots = (scaleNames[0], scaleNames[5])
+    tonicName = key_obj.tonic.name
+
+    signatures = {}  # Distinct pitch names -> index into analyses
+    analyses = []
+    signature, midis, octaves, spellings = [], [], [], []
+    for v in voicings:
+        pitchNames = tuple(name for name, _, _ in v)
+        index = signatures.get(pitchNames)
+        if index is None:
+            index = signatures[pitchNames] = len(analyses)
+            # Only the first voicing with these names is analysed
+            cost, rootName, seventhVoice = _chordAnalysis(
+                tonicName, key_obj.mode, tuple(name if octave < 0 else f'{name}{octave}' for name, octave, _ in v))
+            hasLeadingTone = leadingTone in pitchNames
+            analyses.append((
+                cost,
+                seventhVoice,
+                pitchNames.index(leadingTone) if hasLeadingTone else -1,
+                rootName in dominantRoots and hasLeadingTone,
+                rootName in tonicRoots,
+            ))
+        signature.append(index)
+        midis.extend(midi for _, _, midi in v)
+        octaves.extend(octave for _, octave, _ in v)
+        spellings.extend(7 * midi + LETTER_INDEX[name[0]] for name, _, midi in v)
+
+    signature = np.array(signature, dtype=np.int64)
+    midis = np.array(midis, dtype=np.int16).reshape(-1, 4)
+    costs, seventhVoice, leadingToneVoice, dominant, tonic = zip(*analyses) if analyses else ((),) * 5
+    return {
+        'pitch_names': tuple(signatures),
+        'signature': signature,
+        'midis': midis,
+        'interval_classes': pairIntervalClasses(midis),
+        'spellings': np.array(spellings, dtype=np.int16).reshape(-1, 4),
+        'octaves': np.array(octaves, dtype=np.int8).reshape(-1, 4),
+        'chord_cost': np.array(costs, dtype=np.int64)[signature],
+        'seventh_voice': np.array(seventhVoice, dtype=np.int64)[signature],
+        'leading_tone_voice': np.array(leadingToneVoice, dtype=np.int64)[signature],
+        'dominant': np.array(dominant, dtype=bool)[signature],
+        'tonic': np.array(tonic, dtype=bool)[signature],
+    }
+
+def voicingNames(layer, v):
+    """Pitch names with octaves, bass to soprano, of voicing v of a layer."""
+    names = layer['pitch_names'][layer['signature'][v]]
+    return tuple(name if octave < 0 else f'{name}{octave}' for name, octave in zip(names, layer['octaves'][v]))
+
+def progressionCost(prev, cur):
+    """Computes elements of cost between two chords: contrary motion, etc.
+    
+    Takes two layers of voicings from voicingArrays and returns the cost of
+    every transition as a (len(prev), len(cur)) matrix.
+    """
+    a = prev['midis'][:, None, :]  # (K1, 1, 4)
+    b = cur['midis'][None, :, :]   # (1, K2, 4)
+    cost = np.zeros((a.shape[0], b.shape[1]), dtype=np.int64)
 
     # Overlapping voices
-    if (
-        chord2[0] > chord1[1]
-        or chord2[1] < chord1[0]
-        or chord2[1] > chord1[2]
-        or chord2[2] < chord1[1]
-        or chord2[2] > chord1[3]
-        or chord2[3] < chord1[2]
-    ):
-        cost += 40
+    overlap = (
+        (b[..., 0] > a[..., 1])
+        | (b[..., 1] < a[..., 0])
+        | (b[..., 1] > a[..., 2])
+        | (b[..., 2] < a[..., 1])
+        | (b[..., 2] > a[..., 3])
+        | (b[..., 3] < a[..., 2])
+    )
+    cost += 40 * overlap
 
     # Avoid big jumps
-    diff = [abs(chord1.pitches[i].midi - chord2.pitches[i].midi) for i in range(4)]
-    cost += (diff[3] // 3) ** 2 if diff[3] else 1
-    cost += diff[2] ** 2 // 3
-    cost += diff[1] ** 2 // 3
-    cost += diff[0] ** 2 // 50 if diff[0] != 12 else 0
-
-    # Contrary motion is good, parallel fifths and octaves are bad
-    for i in range(4):
-        for j in range(i + 1, 4):
-            t1, t2 = chord1.pitches[j], chord2.pitches[j]
-            b1, b2 = chord1.pitches[i], chord2.pitches[i]
-            if t1 == t2 and b1 == b2:  # No motion
-                continue
-            i1, i2 = t1.midi - b1.midi, t2.midi - b2.midi
-            
-            # STRENGTHENED: Parallel fifths (very bad)
-            if i1 % 12 == i2 % 12 == 7:  # Parallel fifth
-                cost += 200  # Increased penalty
-            
-            # STRENGTHENED: Parallel octaves (extremely bad)
-            if i1 % 12 == i2 % 12 == 0:  # Parallel octave
-                cost += 300  # Increased penalty
-                
-            # STRENGTHENED: Parallel unisons (also very bad)
-            if abs(i1) == abs(i2) == 0:  # Parallel unison
-                cost += 250
-                
-            # Hidden/direct fifths and octaves (outer voices)
-            if i == 0 and j == 3:  # Bass and soprano
-                if (t2.midi > t1.midi and b2.midi > b1.midi) or (t2.midi < t1.midi and b2.midi < b1.midi):
-                    # Similar motion in outer voices
-                    if abs(i2) % 12 == 7 or abs(i2) % 12 == 0:  # Landing on fifth or octave
-                        cost += 50  # Hidden parallel penalty
-                    else:
-                        cost += 2  # General similar motion penalty
+    diff = np.abs(a - b)
+    cost += np.where(diff[..., 3] != 0, (diff[..., 3] // 3) ** 2, 1)
+    cost += diff[..., 2] ** 2 // 3
+    cost += diff[..., 1] ** 2 // 3
+    cost += np.where(diff[..., 0] != 12, diff[..., 0] ** 2 // 50, 0)
+
+    # Contrary motion is good, parallel fifths and octaves are bad. All six
+    # voice pairs at once: (K1, K2, 6), lower voices PAIR_LOWER, upper PAIR_UPPER
+    moved = prev['spellings'][:, None, :] != cur['spellings'][None, :, :]  # Respelling counts as motion
+    moving = moved[..., PAIR_UPPER] | moved[..., PAIR_LOWER]  # No motion costs nothing
+    # STRENGTHENED: Parallel fifths (very bad), octaves (extremely bad), unisons (also very bad)
+    parallelCost = PARALLEL_COST[4 * prev['interval_classes'][:, None, :] + cur['interval_classes'][None, :, :]]
+    cost += np.einsum('ijk,ijk->ij', moving, parallelCost)
+
+    # Hidden/direct fifths and octaves (outer voices)
+    t1, t2 = a[..., 3], b[..., 3]
+    b1, b2 = a[..., 0], b[..., 0]
+    similar = ((t2 > t1) & (b2 > b1)) | ((t2 < t1) & (b2 < b1))
+    outerClass = np.abs(t2 - b2) % 12
+    landing = (outerClass == 7) | (outerClass == 0)
+    cost += np.where(similar, np.where(landing, 50, 2), 0)
+
+    rows = np.arange(len(prev['midis']))
+    curMidis = cur['midis']
 
     # Chordal 7th should resolve downward or stay
-    if chord1.seventh:
-        seventhVoice = chord1.pitches.index(chord1.seventh)
-        delta = chord2.pitches[seventhVoice].midi - chord1.seventh.midi
-        if delta < -2 or delta > 0:
-            cost += 100
+    seventhVoice = prev['seventh_voice']
+    hasSeventh = seventhVoice >= 0
+    if hasSeventh.any():
+        voice = np.where(hasSeventh, seventhVoice, 0)
+        delta = curMidis[:, voice].T - prev['midis'][rows, voice][:, None]
+        cost += 100 * (hasSeventh[:, None] & ((delta < -2) | (delta > 0)))
 
     # V->I means ti->do or ti->sol
-    pitches = key_obj.getPitches()
-    pitches[6] = key_obj.getLeadingTone()
-    if (
-        chord1.root().name
-        in (
-            pitches[4].name,
-            pitches[6].name,
-        )
-        and chord2.root().name in (pitches[0].name, pitches[5].name)
-        and pitches[6].name in chord1.pitchNames
-    ):
-        voice = chord1.pitchNames.index(pitches[6].name)
-        delta = chord2.pitches[voice].midi - chord1.pitches[voice].midi
-        if not (delta == 1 or (delta == -4 and voice >= 1 and voice <= 2)):
-            cost += 100
+    resolving = prev['dominant'][:, None] & cur['tonic'][None, :]
+    if resolving.any():
+        voice = np.where(prev['dominant'], prev['leading_tone_voice'], 0)
+        delta = curMidis[:, voice].T - prev['midis'][rows, voice][:, None]
+        innerVoice = ((voice >= 1) & (voice <= 2))[:, None]
+        resolved = (delta == 1) | ((delta == -4) & innerVoice)
+        cost += 100 * (resolving & ~resolved)
 
     return cost
 
@@ -487,29 +727,33 @@ def chordCost(key_obj, chord_obj):
     cost = 0
     
     # HEAVILY penalize incomplete chords
-    pitch_classes = [p.pitchClass for p in chord_obj.pitches]
-    unique_pitch_classes = set(pitch_classes)
+    # Pitch classes present as a 12-bit mask, and how often each occurs
+    pc_mask = 0
+    pc_counts = [0] * 12
+    for p in chord_obj.pitches:
+        pc_mask |= 1 << p.pitchClass
+        pc_counts[p.pitchClass] += 1
     
     # Check for missing chord tones (root, third, fifth)
     root_pc = chord_obj.root().pitchClass
     third_pc = chord_obj.third.pitchClass if chord_obj.third else None
     fifth_pc = chord_obj.fifth.pitchClass if chord_obj.fifth else None
     
-    if root_pc not in unique_pitch_classes:
+    if not pc_mask >> root_pc & 1:
         cost += 500  # Missing root is very bad
-    if third_pc and third_pc not in unique_pitch_classes:
+    if third_pc and not pc_mask >> third_pc & 1:
         cost += 300  # Missing third is very bad
-    if fifth_pc and fifth_pc not in unique_pitch_classes:
+    if fifth_pc and not pc_mask >> fifth_pc & 1:
         cost += 200  # Missing fifth is bad
     
     # Prefer to double the root in root position chords
     if chord_obj.inversion() == 0:
-        if pitch_classes.count(root_pc) <= 1:
+        if pc_counts[root_pc] <= 1:
             cost += 10  # Light penalty for not doubling root
     
     # Penalize doubling leading tone
-    leading_tone_pc = key_obj.getLeadingTone().pitchClass
-    if pitch_classes.count(leading_tone_pc) > 1:
+    leading_tone_pc = key_table(key_obj)['leading_tone_pc']
+    if pc_counts[leading_tone_pc] > 1:
         cost += 100  # Heavy penalty for doubling leading tone
     
     return cost
@@ -519,60 +763,158 @@ def voiceProgression(key_obj, chordProgression):
     if isinstance(chordProgression, str):
         chordProgression = list(filter(None, chordProgression.split()))
 
-    dp = [{} for _ in chordProgression]
-    for i, numeral in enumerate(chordProgression):
-        chord_obj = roman.RomanNumeral(numeral, key_obj)
-        voicings = voiceChord(key_obj, chord_obj)
-        if i == 0:
-            for v in voicings:
-                dp[0][v.pitches] = (chordCost(key_obj, v), None)
-        else:
-            for v in voicings:
-                best = (float("inf"), None)
-                for pv_pitches, (pcost, _) in dp[i - 1].items():
-                    pv = chord.Chord(pv_pitches)
-                    ccost = pcost + progressionCost(key_obj, pv, v)
-                    if ccost < best[0]:
-                        best = (ccost, pv_pitches)
-                dp[i][v.pitches] = (best[0] + chordCost(key_obj, v), best[1])
-
-    cur, (totalCost, _) = min(dp[-1].items(), key=lambda p: p[1][0])
-    ret = []
-    for i in reversed(range(len(chordProgression))):
-        ret.append(chord.Chord(cur, lyric=chordProgression[i]))
-        cur = dp[i][cur][1]
-    return list(reversed(ret)), totalCost
+    layers = _voicings_for(key_obj.tonic.name, key_obj.mode, chordProgression)
+
+    best, backptrs = _dp(layers)
+    path = _backtrace(best, backptrs)
+    totalCost = int(best[-1][path[-1]])
+    ret = [
+        chord.Chord(voicingNames(layers[i], v), lyric=chordProgression[i])
+        for i, v in enumerate(path)
+    ]
+    return ret, totalCost
+
+# Voicing layers shared across requests, keyed on (tonic, mode, roman numeral)
+# strings because music21 objects are not hashable. Oldest entries go first.
+VOICING_CACHE_SIZE = 4096
+_voicing_layers = {}
+_voicing_layers_lock = threading.Lock()
+
+# Uncached chords are voiced in worker processes when a progression has at least
+# this many of them; below that, process dispatch costs more than it saves.
+# Off by default: each worker spawns its own music21 with cold caches, which
+# costs seconds on first use and memory in every gunicorn worker
+VOICING_PROCESSES = int(os.environ.get('VOICING_PROCESSES', 1))
+PARALLEL_VOICING_MIN_CHORDS = 3
+_voicing_pool = None
+_voicing_pool_lock = threading.Lock()
+
+def _voicing_executor():
+    """Process pool for voicing enumeration, started on first use."""
+    global _voicing_pool
+    with _voicing_pool_lock:
+        if _voicing_pool is None:
+            # Spawned rather than forked: forking a threaded server can copy held locks
+            _voicing_pool = ProcessPoolExecutor(max_workers=VOICING_PROCESSES,
+                                                mp_context=multiprocessing.get_context('spawn'))
+        return _voicing_pool
+
+@functools.lru_cache(maxsize=1024)
+def _roman_numeral(numeral, tonic, mode):
+    """Parsed Roman numeral in a key, shared across requests; callers only read it."""
+    return roman.RomanNumeral(numeral, _key_for(tonic, mode))
+
+def _build_voicings(tonic, mode, roman_numeral):
+    """Voicing layer of a Roman numeral in a key; runs in a worker process when parallel."""
+    key_obj = _key_for(tonic, mode)
+    chord_obj = _roman_numeral(roman_numeral, tonic, mode)
+    return voicingArrays(key_obj, voiceChord(key_obj, chord_obj))
+
+def _voicings_for(tonic, mode, roman_numerals):
+    """Voicing layers of Roman numerals in a key, one per numeral.
+    
+    Layers not yet cached are built together, across processes when there are
+    enough of them. The arrays are made read-only since every caller gets the
+    same objects.
+    """
+    found = {}
+    with _voicing_layers_lock:
+        for numeral in roman_numerals:
+            layer = _voicing_layers.get((tonic, mode, numeral))
+            if layer is not None:
+                found[numeral] = layer
+    missing = [numeral for numeral in dict.fromkeys(roman_numerals) if numeral not in found]
+
+    if VOICING_PROCESSES > 1 and len(missing) >= PARALLEL_VOICING_MIN_CHORDS:
+        built = list(_voicing_executor().map(_build_voicings, itertools.repeat(tonic), itertools.repeat(mode), missing))
+    else:
+        built = [_build_voicings(tonic, mode, numeral) for numeral in missing]
+
+    with _voicing_layers_lock:
+        for numeral, layer in zip(missing, built):
+            for value in layer.values():
+                if isinstance(value, np.ndarray):
+                    value.setflags(write=False)
+            found[numeral] = _voicing_layers[(tonic, mode, numeral)] = layer
+        while len(_voicing_layers) > VOICING_CACHE_SIZE:
+            del _voicing_layers[next(iter(_voicing_layers))]
+    return [found[numeral] for numeral in roman_numerals]
+
+# Number of lowest-cost voicings per chord carried into the next DP step;
+# None searches every voicing
+BEAM_WIDTH = 64
+
+def _dp(layers, beam=BEAM_WIDTH):
+    """Runs the voice-leading DP over layers of voicings from voicingArrays.
+    
+    Only the `beam` cheapest voicings of each chord are extended to the next
+    chord. Returns, per chord, the best total cost of reaching each of its
+    voicings and the index of the voicing of the previous chord it came from
+    (None for the first chord).
+    
+    On the last chord only the overall cheapest path matters, so its
+    predecessors are branch-and-bounded: the path through the cheapest one
+    sets an incumbent, and predecessors that cannot beat it even with a free
+    transition are skipped. Costs of the last chord's other voicings may then
+    be overestimates; the minimum and its path are exact.
+    """
+    best = [layers[0]['chord_cost']]
+    backptrs = [None]
+    for i in range(1, len(layers)):
+        prevCost = best[i - 1]
+        keep = np.arange(len(prevCost))
+        if beam is not None and len(keep) > beam:
+            # Sorted so ties still resolve to the earliest voicing
+            keep = np.sort(np.argsort(prevCost, kind='stable')[:beam])
+        if i == len(layers) - 1 and len(keep) > 1:
+            first = keep[np.argmin(prevCost[keep])]
+            incumbent = np.min(prevCost[first] + layers[i]['chord_cost']
+                               + progressionCost(_layerRows(layers[i - 1], [first]), layers[i])[0])
+            keep = keep[prevCost[keep] + layers[i]['chord_cost'].min() <= incumbent]
+        total = prevCost[keep][:, None] + progressionCost(_layerRows(layers[i - 1], keep), layers[i])
+        back = np.argmin(total, axis=0)
+        best.append(total[back, np.arange(len(back))] + layers[i]['chord_cost'])
+        backptrs.append(keep[back])
+    return best, backptrs
+
+# Per-voicing fields progressionCost reads from the previous layer
+TRANSITION_FIELDS = ('midis', 'interval_classes', 'spellings', 'seventh_voice', 'leading_tone_voice', 'dominant')
+
+def _layerRows(layer, rows):
+    """The given voicings of a layer, as a previous layer progressionCost can score."""
+    return {name: layer[name][rows] for name in TRANSITION_FIELDS}
+
+def _backtrace(best, backptrs):
+    """Returns the index of the chosen voicing for each chord, first chord first."""
+    cur = int(np.argmin(best[-1]))
+    path = [cur]
+    for i in reversed(range(1, len(best))):
+        cur = int(backptrs[i][cur])
+        path.append(cur)
+    return list(reversed(path))
+
+def _build_fixed_bass_voicings(tonic, mode, roman_numeral, bass_name):
+    """Voicing layer of a Roman numeral over a given bass note."""
+    key_obj = _key_for(tonic, mode)
+    chord_symbol = _roman_numeral(roman_numeral, tonic, mode)
+    voicings = voiceChordWithFixedBass(key_obj, chord_symbol, note.Note(bass_name))
+    return voicingArrays(key_obj, map(voicedNotes, voicings))
 
 def voiceProgressionWithFixedBass(key_obj, chord_progression, bass_notes):
     """Voice a chord progression with a fixed bass line using dynamic programming."""
     if isinstance(chord_progression, str):
         chord_progression = list(filter(None, chord_progression.split()))
 
-    dp = [{} for _ in chord_progression]
+    tonic, mode = key_obj.tonic.name, key_obj.mode
+    # The bass note each chord must use
+    bass_names = [bass_notes[i].nameWithOctave for i in range(len(chord_progression))]
     
-    for i, numeral in enumerate(chord_progression):
-        chord_symbol = roman.RomanNumeral(numeral, key_obj)
-        fixed_bass = bass_notes[i]  # The bass note we must use
-        
-        # Generate voicings that include our required bass note
-        print(f"Calling voiceChordWithFixedBass for chord {i+1}: {numeral}")
-        voicings = voiceChordWithFixedBass(key_obj, chord_symbol, fixed_bass)
-        print(f"Got {len(voicings)} voicings for chord {i+1}")
-        
-        if i == 0:
-            for v in voicings:
-                dp[0][v.pitches] = (chordCost(key_obj, v), None)
-        else:
-            for v in voicings:
-                best = (float("inf"), None)
-                for pv_pitches, (pcost, _) in dp[i - 1].items():
-                    pv = chord.Chord(pv_pitches)
-                    ccost = pcost + progressionCost(key_obj, pv, v)
-                    if ccost < best[0]:
-                        best = (ccost, pv_pitches)
-                dp[i][v.pitches] = (best[0] + chordCost(key_obj, v), best[1])
-
-    if not dp[-1]:
+    # Generate voicings that include our required bass notes. Each chord is only
+    # about a millisecond of work, too little to be worth a process round trip
+    layers = [_build_fixed_bass_voicings(tonic, mode, numeral, bass_name)
+              for numeral, bass_name in zip(chord_progression, bass_names)]
+
+    if not layers or not all(len(layer['midis']) for layer in layers):
         # Fallback if no valid voicings found
         fallback_compromises = [{
             'type': 'fallback_used',
@@ -582,21 +924,24 @@ def voiceProgressionWithFixedBass(key_obj, chord_progression, bass_notes):
         }]
         return generate_simple_fallback_chords(chord_progression, bass_notes), float('inf'), fallback_compromises
     
-    cur, (totalCost, _) = min(dp[-1].items(), key=lambda p: p[1][0])
+    best, backptrs = _dp(layers)
+    path = _backtrace(best, backptrs)
+    totalCost = int(best[-1][path[-1]])
     ret = []
     chord_costs = []  # Track individual chord costs for compromise analysis
     
-    for i in reversed(range(len(chord_progression))):
-        chord_obj = chord.Chord(cur, lyric=chord_progression[i])
-        ret.append(chord_obj)
+    for i, v in enumerate(path):
+        ret.append(chord.Chord(voicingNames(layers[i], v), lyric=chord_progression[i]))
         # Store the cost for this specific chord
-        chord_costs.append(dp[i][cur][0] - (dp[i-1][dp[i][cur][1]][0] if i > 0 and dp[i][cur][1] else 0))
-        cur = dp[i][cur][1]
+        chord_costs.append(int(best[i][v]) - (int(best[i - 1][path[i - 1]]) if i > 0 else 0))
     
     # Analyze compromises made
-    compromises = analyze_compromises(list(reversed(ret)), list(reversed(chord_costs)), totalCost)
+    compromises = analyze_compromises(ret, chord_costs, totalCost)
     
-    return list(reversed(ret)), totalCost, compromises
+    return ret, totalCost, compromises
+
+# Perfect intervals, in semitones above the lower voice mod 12, reported as forced parallels
+PARALLEL_INTERVAL_NAMES = {7: 'p5', 0: 'p8'}
 
 def analyze_compromises(chords, chord_costs, total_cost):
     """Analyze what compromises were made during SATB generation."""
@@ -647,59 +992,49 @@ def analyze_compromises(chords, chord_costs, total_cost):
             })
     
     # Check for specific forced compromises
+    voice_names = ['Bass', 'Tenor', 'Alto', 'Soprano']
+    midis = [[p.midi for p in chord_obj.pitches] for chord_obj in chords]
     for i in range(len(chords) - 1):
-        current_chord = chords[i]
-        next_chord = chords[i + 1]
+        current_midis = midis[i]
+        next_midis = midis[i + 1]
         
         # Check if parallel motion was forced
-        for j in range(4):
-            for k in range(j + 1, 4):
-                try:
-                    interval1 = interval.Interval(current_chord.pitches[j], current_chord.pitches[k])
-                    interval2 = interval.Interval(next_chord.pitches[j], next_chord.pitches[k])
-                    
-                    if (interval1.simpleName == 'P5' and interval2.simpleName == 'P5') or \
-                       (interval1.simpleName == 'P8' and interval2.simpleName == 'P8'):
-                        voice_names = ['Bass', 'Tenor', 'Alto', 'Soprano']
-                        compromises.append({
-                            'type': 'forced_parallels',
-                            'severity': 'high',
-                            'location': f'Chords {i+1}-{i+2}',
-                            'description': f'Parallel {interval1.simpleName.lower()}s between {voice_names[j]} and {voice_names[k]} were unavoidable',
-                            'explanation': 'The fixed bass line made it impossible to avoid this parallel motion while maintaining proper voice leading elsewhere.'
-                        })
-                except:
-                    continue
+        for j, k in VOICE_PAIRS:
+            # Intervals reduced to within an octave, in semitones
+            interval1 = abs(current_midis[k] - current_midis[j]) % 12
+            interval2 = abs(next_midis[k] - next_midis[j]) % 12
+            
+            # Both voices held is not parallel motion, and unisons are not octaves
+            moved = current_midis[j] != next_midis[j] or current_midis[k] != next_midis[k]
+            unison = current_midis[j] == current_midis[k] or next_midis[j] == next_midis[k]
+            if moved and not unison and interval1 == interval2 and interval1 in PARALLEL_INTERVAL_NAMES:
+                compromises.append({
+                    'type': 'forced_parallels',
+                    'severity': 'high',
+                    'location': f'Chords {i+1}-{i+2}',
+                    'description': f'Parallel {PARALLEL_INTERVAL_NAMES[interval1]}s between {voice_names[j]} and {voice_names[k]} were unavoidable',
+                    'explanation': 'The fixed bass line made it impossible to avoid this parallel motion while maintaining proper voice leading elsewhere.'
+                })
     
     return compromises
 
+# Stricter upper-voice ranges for voicing over a fixed bass, as (name, octave, midi) bounds
+FIXED_BASS_SOPRANO_RANGE, FIXED_BASS_ALTO_RANGE, FIXED_BASS_TENOR_RANGE = (
+    tuple((p.name, p.octave, p.midi) for p in map(pitch.Pitch, bounds))
+    for bounds in (("C4", "G5"), ("G3", "C5"), ("C3", "G4"))
+)
+
 def voiceChordWithFixedBass(key_obj, chord_symbol, fixed_bass):
     """Generate voicings for a chord with a specific bass note - COMPLETELY REWRITTEN."""
-    voicings = []
-    
-    # Get the chord tones (root, third, fifth, seventh if present)
+    # Get the chord tones (root, third, fifth)
     root = chord_symbol.root()
     third = chord_symbol.third  
     fifth = chord_symbol.fifth
-    seventh = chord_symbol.seventh if chord_symbol.containsSeventh() else None
-    
-    # All available chord tones
-    chord_tones = [root.name, third.name, fifth.name]
-    if seventh:
-        chord_tones.append(seventh.name)
-    
-    print(f"Generating voicings for {chord_symbol} with bass={fixed_bass.nameWithOctave}")
-    print(f"Chord tones: {chord_tones}")
     
     # STRATEGY: Generate COMPLETE triads with proper doubling
     # Priority: 1) Root doubling, 2) Fifth doubling, 3) Third doubling (avoid leading tone doubling)
     
-    leading_tone = key_obj.getLeadingTone().name
-    
-    # Define voice ranges more strictly
-    soprano_range = (pitch.Pitch("C4"), pitch.Pitch("G5"))
-    alto_range = (pitch.Pitch("G3"), pitch.Pitch("C5"))  
-    tenor_range = (pitch.Pitch("C3"), pitch.Pitch("G4"))
+    leading_tone = key_table(key_obj)['leading_tone']
     
     # Generate complete chord voicings
     doubling_priority = []
@@ -710,71 +1045,57 @@ def voiceChordWithFixedBass(key_obj, chord_symbol, fixed_bass):
     if third.name != leading_tone:
         doubling_priority.append(third.name)  # Third doubling last
     
-    for double_note in doubling_priority:
-        # Create a complete triad with one note doubled
-        triad_notes = [root.name, third.name, fifth.name, double_note]
-        
-        # Generate all permutations for tenor, alto, soprano (bass is fixed)
-        import itertools
-        for soprano_note, alto_note, tenor_note in itertools.permutations(triad_notes[1:], 3):
-            # Try different octaves
-            for sop_oct in range(4, 6):
-                for alto_oct in range(3, 5):
-                    for ten_oct in range(3, 5):
-                        try:
-                            soprano = pitch.Pitch(soprano_note + str(sop_oct))
-                            alto = pitch.Pitch(alto_note + str(alto_oct))
-                            tenor = pitch.Pitch(tenor_note + str(ten_oct))
-                            
-                            # Check voice ranges
-                            if not (soprano_range[0] <= soprano <= soprano_range[1]):
-                                continue
-                            if not (alto_range[0] <= alto <= alto_range[1]):
-                                continue  
-                            if not (tenor_range[0] <= tenor <= tenor_range[1]):
-                                continue
-                            
-                            # Check voice ordering: Bass < Tenor < Alto < Soprano
-                            if not (fixed_bass.pitch < tenor < alto < soprano):
-                                continue
-                                
-                            # Check spacing (upper voices within octave)
-                            if soprano.midi - alto.midi > 12:  # Soprano-Alto > octave
-                                continue
-                            if alto.midi - tenor.midi > 12:  # Alto-Tenor > octave  
+    # Stage 1: the (name, octave, midi) placements of each chord tone that fit
+    # each upper voice's range, lowest first
+    def placements(octaves, voice_range):
+        return {
+            n: [v for v in ((n, o, 12 * (o + 1) + _pitchOffset(n)) for o in octaves) if inPitchRange(v, voice_range)]
+            for n in {root.name, third.name, fifth.name}
+        }
+    soprano_options = placements(range(4, 6), FIXED_BASS_SOPRANO_RANGE)
+    alto_options = placements(range(3, 5), FIXED_BASS_ALTO_RANGE)
+    tenor_options = placements(range(3, 5), FIXED_BASS_TENOR_RANGE)
+    bass_midi = fixed_bass.pitch.midi
+    
+    def candidates():
+        for double_note in doubling_priority:
+            # Create a complete triad with one note doubled
+            triad_notes = [root.name, third.name, fifth.name, double_note]
+            
+            # Generate all permutations for tenor, alto, soprano (bass is fixed)
+            for soprano_note, alto_note, tenor_note in itertools.permutations(triad_notes[1:], 3):
+                # Stage 2: combine placements top down, checking ordering and
+                # spacing against the voices already placed
+                for soprano in soprano_options[soprano_note]:
+                    for alto in alto_options[alto_note]:
+                        # Above the bass and below the soprano, within an octave of it
+                        if not (bass_midi < alto[2] < soprano[2]) or soprano[2] - alto[2] > 12:
+                            continue
+                        
+                        for tenor in tenor_options[tenor_note]:
+                            # Bass < Tenor < Alto, tenor within an octave of the alto
+                            if not (bass_midi < tenor[2] < alto[2]) or alto[2] - tenor[2] > 12:
                                 continue
                             
-                            # Create the chord
-                            voicing = chord.Chord([fixed_bass.pitch, tenor, alto, soprano])
-                            voicings.append(voicing)
-                            
-                        except:
-                            continue
-        
-        # Limit voicings to prevent explosion
-        if len(voicings) > 20:
-            break
+                            # Stage 3: only survivors become Chords
+                            yield chord.Chord([fixed_bass.pitch] + [f'{name}{octave}' for name, octave, _ in (tenor, alto, soprano)])
     
-    print(f"Generated {len(voicings)} voicings")
+    # Only the first 10 are used, so stop generating once they are found
+    voicings = list(itertools.islice(candidates(), 10))
     
     # If no voicings found, create a simple fallback
     if not voicings:
         print("No valid voicings found, creating fallback")
-        try:
-            # Simple fallback: root position with doubled root
-            soprano = pitch.Pitch(root.name + "5")
-            alto = pitch.Pitch(third.name + "4") 
-            tenor = pitch.Pitch(fifth.name + "4")
-            if alto < tenor:  # Fix ordering if needed
-                alto, tenor = tenor, alto
-            voicing = chord.Chord([fixed_bass.pitch, tenor, alto, soprano])
-            voicings.append(voicing)
-        except:
-            # Last resort fallback
-            voicing = chord.Chord([fixed_bass.pitch, fixed_bass.pitch.transpose(4), fixed_bass.pitch.transpose(7), fixed_bass.pitch.transpose(12)])
-            voicings.append(voicing)
-    
-    return voicings[:10]  # Return best 10
+        # Simple fallback: root position with doubled root
+        soprano = pitch.Pitch(root.name + "5")
+        alto = pitch.Pitch(third.name + "4") 
+        tenor = pitch.Pitch(fifth.name + "4")
+        if alto < tenor:  # Fix ordering if needed
+            alto, tenor = tenor, alto
+        voicing = chord.Chord([fixed_bass.pitch, tenor, alto, soprano])
+        voicings.append(voicing)
+    
+    return voicings
 
 def create_simple_voicing_with_bass(chord_symbol, fixed_bass):
     """Create a simple voicing when complex voicing fails."""
@@ -809,15 +1130,15 @@ def generate_satb_harmonization(chord_progression, bass_notes, key_name):
             mode = key_parts[1].lower()
             if 'b' in tonic:
                 tonic = tonic.replace('b', '-')
-            key_obj = key.Key(tonic, mode)
+            key_obj = _key_for(tonic, mode)
         else:
-            key_obj = key.Key('C', 'major')
+            key_obj = _key_for('C', 'major')
         
         # Convert bass notes to music21 Note objects with proper octaves
         bass_note_objects = []
         for bass_note_name in bass_notes:
             # Ensure octave is present
-            if not any(char.isdigit() for char in bass_note_name):
+            if DIGITS.isdisjoint(bass_note_name):
                 bass_note_name += '3'  # Default bass octave
             bass_note_objects.append(note.Note(bass_note_name))
         
@@ -856,18 +1177,18 @@ def generate_satb_harmonization(chord_progression, bass_notes, key_name):
 
 
 
+# Every chord of the fallback harmonization
+FALLBACK_SATB_CHORD = {
+    'soprano': 'C5',
+    'alto': 'G4', 
+    'tenor': 'E4',
+    'bass': 'C3',
+    'chord': 'I'
+}
+
 def generate_fallback_satb(num_chords):
     """Generate a fallback SATB harmonization."""
-    fallback = []
-    for i in range(num_chords):
-        fallback.append({
-            'soprano': 'C5',
-            'alto': 'G4', 
-            'tenor': 'E4',
-            'bass': 'C3',
-            'chord': 'I'
-        })
-    return fallback
+    return [dict(FALLBACK_SATB_CHORD) for _ in range(num_chords)]
 
 @app.route('/health', methods=['GET'])
 def health_check():
@@ -876,16 +1197,65 @@ def health_check():
 
 @app.route('/debug-env', methods=['GET'])
 def debug_env():
-    """Debug endpoint to see what environment variables are available"""
+    """Debug endpoint to see what environment variables are available (names only, never values)"""
     env_vars = {}
     for key, value in os.environ.items():
         if 'REPLICATE' in key or 'API' in key:
-            env_vars[key] = value
+            env_vars[key] = bool(value)  # Set and non-empty; the values are secrets
     return jsonify({
         'replicate_vars': env_vars,
         'all_keys': list(os.environ.keys())
     })
 
+@functools.lru_cache(maxsize=2048)
+def _parsed_pitch(name):
+    """Shared, read-only Pitch for a note name such as 'C#4'; harmonizations reuse a few dozen."""
+    return pitch.Pitch(name)
+
+# validate_satb_rules stops at the first chord pair after this many issues once
+# the errors alone have brought the score to 0
+MAX_VALIDATION_ERRORS = 50
+
+# Largest leap in semitones that passes without comment, bass to soprano:
+# the bass can leap up to an octave, the other voices a sixth
+MAX_LEAPS = np.array([12, 6, 6, 6])
+
+def _satb_checks(midis, steps, notes):
+    """Numeric SATB rule checks over a whole progression.
+    
+    midis holds (chords, 4) MIDI numbers, bass to soprano, steps the matching
+    diatonic note numbers, and notes the same shape with anything that compares
+    equal only for the same spelled note (names with octave, or integer ids), so
+    enharmonic respellings count as motion. Returns per-chord arrays ('spacing'
+    between adjacent voices and 'crossings') and per-transition ones ('leaps',
+    'large_leaps', and 'parallel_fifths', 'parallel_octaves', 'parallel_unisons'
+    over VOICE_PAIRS), plus the pair 'spans' that tell octaves from unisons.
+    """
+    spans = np.abs(midis[:, PAIR_UPPER] - midis[:, PAIR_LOWER])
+    # Spelled intervals, as music21 names them: a perfect fifth is a generic
+    # fifth of 7 semitones, a perfect unison or octave a generic unison of 0,
+    # both reduced by octaves. Enharmonic ones such as C4-B#4 are not perfect.
+    generic = steps[:, PAIR_UPPER] - steps[:, PAIR_LOWER]
+    semitones = np.where(generic < 0, -1, 1) * (midis[:, PAIR_UPPER] - midis[:, PAIR_LOWER])
+    generic = np.abs(generic) % 7
+    perfect_fifths = (generic == 4) & (semitones % 12 == 7)
+    perfect_octaves = (generic == 0) & (semitones % 12 == 0)
+    moved = notes[:-1] != notes[1:]
+    pair_moved = moved[:, PAIR_LOWER] | moved[:, PAIR_UPPER]  # Same notes again are not parallels
+    same_note = notes[:, PAIR_LOWER] == notes[:, PAIR_UPPER]
+    spacing = np.diff(midis, axis=1)
+    leaps = np.abs(np.diff(midis, axis=0))
+    return {
+        'spans': spans,
+        'parallel_fifths': perfect_fifths[:-1] & perfect_fifths[1:] & pair_moved,
+        'parallel_octaves': perfect_octaves[:-1] & perfect_octaves[1:] & pair_moved,
+        'parallel_unisons': same_note[:-1] & same_note[1:] & pair_moved,
+        'spacing': spacing,
+        'crossings': spacing < 0,
+        'leaps': leaps,
+        'large_leaps': leaps > MAX_LEAPS,
+    }
+
 def validate_satb_rules(satb_data, chord_progression, key_name, compromises=None):
     """Comprehensive SATB rule validation with specific error identification and solutions."""
     
@@ -899,28 +1269,28 @@ def validate_satb_rules(satb_data, chord_progression, key_name, compromises=None
     
     errors = []
     warnings = []
-    suggestions = []
+    suggestions = {}  # Used as an ordered set, so repeated suggestions are stored once
     
     try:
-        # Parse key
-        key_obj = key.Key(key_name.split()[0], key_name.split()[1] if len(key_name.split()) > 1 else 'major')
+        # Parse key; the Key object and its leading tone and tonic are shared across calls
+        key_parts = key_name.split()
+        key_obj = _key_for(key_parts[0], key_parts[1] if len(key_parts) > 1 else 'major')
+        leading_tone_name = key_table(key_obj)['leading_tone']
+        tonic_name = key_obj.tonic.name
         
         # Convert SATB data to Music21 objects for analysis
         chords = []
-        print(f"Validating {len(satb_data)} chords...")
         for i, chord_data in enumerate(satb_data):
             try:
-                soprano_pitch = pitch.Pitch(chord_data['soprano'])
-                alto_pitch = pitch.Pitch(chord_data['alto'])
-                tenor_pitch = pitch.Pitch(chord_data['tenor'])
-                bass_pitch = pitch.Pitch(chord_data['bass'])
+                soprano_pitch = _parsed_pitch(chord_data['soprano'])
+                alto_pitch = _parsed_pitch(chord_data['alto'])
+                tenor_pitch = _parsed_pitch(chord_data['tenor'])
+                bass_pitch = _parsed_pitch(chord_data['bass'])
                 
                 chord_obj = chord.Chord([bass_pitch, tenor_pitch, alto_pitch, soprano_pitch])
                 chords.append(chord_obj)
-                print(f"Chord {i+1}: B={bass_pitch.nameWithOctave}, T={tenor_pitch.nameWithOctave}, A={alto_pitch.nameWithOctave}, S={soprano_pitch.nameWithOctave}")
-            except Exception as e:
-                print(f"Error parsing chord {i+1}: {e}")
-                continue
+            except Exception:
+                continue  # Skip chords with unreadable notes
         
         if len(chords) < 2:
             return {
@@ -930,115 +1300,113 @@ def validate_satb_rules(satb_data, chord_progression, key_name, compromises=None
                 'suggestions': ['Try generating a new harmonization']
             }
         
+        # Numeric checks for every chord and transition at once
+        chord_midis = np.array([[p.midi for p in chord_obj.pitches] for chord_obj in chords], dtype=np.int16)
+        chord_steps = np.array([[p.diatonicNoteNum for p in chord_obj.pitches] for chord_obj in chords], dtype=np.int16)
+        chord_names = np.array([[p.nameWithOctave for p in chord_obj.pitches] for chord_obj in chords])
+        checks = _satb_checks(chord_midis, chord_steps, chord_names)
+        spans, parallel_fifths, parallel_octaves, parallel_unisons = \
+            checks['spans'], checks['parallel_fifths'], checks['parallel_octaves'], checks['parallel_unisons']
+        spacing, crossings, leaps, large_leaps = \
+            checks['spacing'], checks['crossings'], checks['leaps'], checks['large_leaps']
+        # (transitions, 4): voices holding the leading tone that do not move to the tonic
+        pitch_names = np.array([[p.name for p in chord_obj.pitches] for chord_obj in chords])
+        unresolved_leading_tones = (pitch_names[:-1] == leading_tone_name) & (pitch_names[1:] != tonic_name)
+        
+        voice_names = ['Bass', 'Tenor', 'Alto', 'Soprano']
+        voice_ranges = [BASS_RANGE, TENOR_RANGE, ALTO_RANGE, SOPRANO_RANGE]
+        
+        # Voice range violations, once per chord
+        for chord_num, chord_obj in enumerate(chords, 1):
+            for p, voice_name, voice_range in zip(chord_obj.pitches, voice_names, voice_ranges):
+                if not (voice_range[0] <= p <= voice_range[1]):
+                    errors.append({
+                        'type': 'voice_range',
+                        'location': f'Chord {chord_num}',
+                        'voice': voice_name,
+                        'description': f'{voice_name} note {p.name}{p.octave} is outside normal range',
+                        'severity': 'error'
+                    })
+                    suggestions[f'Move {voice_name} to within {voice_range[0].name}{voice_range[0].octave}-{voice_range[1].name}{voice_range[1].octave}'] = None
+        
         # Analyze each chord pair for voice leading errors
         for i in range(len(chords) - 1):
+            # Stop once there are plenty of issues to show and the score is
+            # already down to 0; further ones would change nothing
+            if len(errors) >= MAX_VALIDATION_ERRORS and \
+               sum(e['severity'] == 'error' for e in errors) * 20 >= 100:
+                break
+            
             current_chord = chords[i]
-            next_chord = chords[i + 1]
             chord_num = i + 1
             
-            # Check voice ranges
-            current_pitches = [current_chord.pitches[j] for j in range(4)]
-            next_pitches = [next_chord.pitches[j] for j in range(4)]
-            
-            voice_names = ['Bass', 'Tenor', 'Alto', 'Soprano']
-            voice_ranges = [BASS_RANGE, TENOR_RANGE, ALTO_RANGE, SOPRANO_RANGE]
+            current_pitches = current_chord.pitches
             
-            for j, (current_p, next_p, voice_name, voice_range) in enumerate(zip(current_pitches, next_pitches, voice_names, voice_ranges)):
-                # Voice range violations
-                if not (voice_range[0] <= current_p <= voice_range[1]):
+            # Check for parallel fifths and octaves
+            for pair, (j, k) in enumerate(VOICE_PAIRS):
+                # Parallel fifths
+                if parallel_fifths[i, pair]:
                     errors.append({
-                        'type': 'voice_range',
-                        'location': f'Chord {chord_num}',
-                        'voice': voice_name,
-                        'description': f'{voice_name} note {current_p.name}{current_p.octave} is outside normal range',
+                        'type': 'parallel_fifths',
+                        'location': f'Chords {chord_num}-{chord_num + 1}',
+                        'voice': f'{voice_names[j]} and {voice_names[k]}',
+                        'description': f'Parallel fifths between {voice_names[j]} and {voice_names[k]}',
                         'severity': 'error'
                     })
-                    suggestions.append(f'Move {voice_name} to within {voice_range[0].name}{voice_range[0].octave}-{voice_range[1].name}{voice_range[1].octave}')
+                    suggestions[f'Change chord voicing or try different chord progression at position {chord_num}'] = None
                 
-                if not (voice_range[0] <= next_p <= voice_range[1]):
+                # Parallel octaves AND unisons (P1 = unison = same note)
+                if parallel_octaves[i, pair]:
+                    interval_type = "unisons" if spans[i, pair] == 0 else "octaves"
                     errors.append({
-                        'type': 'voice_range',
-                        'location': f'Chord {chord_num + 1}',
-                        'voice': voice_name,
-                        'description': f'{voice_name} note {next_p.name}{next_p.octave} is outside normal range',
+                        'type': f'parallel_{interval_type}',
+                        'location': f'Chords {chord_num}-{chord_num + 1}',
+                        'voice': f'{voice_names[j]} and {voice_names[k]}',
+                        'description': f'Parallel {interval_type} between {voice_names[j]} and {voice_names[k]}',
                         'severity': 'error'
                     })
-            
-            # Check for parallel fifths and octaves
-            for j in range(4):
-                for k in range(j + 1, 4):
-                    interval1 = interval.Interval(current_pitches[j], current_pitches[k])
-                    interval2 = interval.Interval(next_pitches[j], next_pitches[k])
-                    
-                    print(f"Checking {voice_names[j]}-{voice_names[k]}: {interval1.simpleName} -> {interval2.simpleName}")
-                    
-                    # Parallel fifths
-                    if interval1.simpleName == 'P5' and interval2.simpleName == 'P5':
-                        if current_pitches[j] != next_pitches[j] or current_pitches[k] != next_pitches[k]:
-                            print(f"FOUND PARALLEL FIFTHS: {voice_names[j]} and {voice_names[k]}")
-                            errors.append({
-                                'type': 'parallel_fifths',
-                                'location': f'Chords {chord_num}-{chord_num + 1}',
-                                'voice': f'{voice_names[j]} and {voice_names[k]}',
-                                'description': f'Parallel fifths between {voice_names[j]} and {voice_names[k]}',
-                                'severity': 'error'
-                            })
-                            suggestions.append(f'Change chord voicing or try different chord progression at position {chord_num}')
-                    
-                    # Parallel octaves AND unisons (P1 = unison = same note)
-                    if (interval1.simpleName == 'P8' and interval2.simpleName == 'P8') or \
-                       (interval1.simpleName == 'P1' and interval2.simpleName == 'P1'):
-                        if current_pitches[j] != next_pitches[j] or current_pitches[k] != next_pitches[k]:
-                            interval_type = "unisons" if interval1.simpleName == 'P1' else "octaves"
-                            print(f"FOUND PARALLEL {interval_type.upper()}: {voice_names[j]} and {voice_names[k]}")
-                            errors.append({
-                                'type': f'parallel_{interval_type}',
-                                'location': f'Chords {chord_num}-{chord_num + 1}',
-                                'voice': f'{voice_names[j]} and {voice_names[k]}',
-                                'description': f'Parallel {interval_type} between {voice_names[j]} and {voice_names[k]}',
-                                'severity': 'error'
-                            })
-                            suggestions.append(f'Change chord voicing or try different chord progression at position {chord_num}')
-                    
-                    # Parallel unisons (same note repeated in different voices)
-                    if current_pitches[j].nameWithOctave == current_pitches[k].nameWithOctave and next_pitches[j].nameWithOctave == next_pitches[k].nameWithOctave:
-                        if current_pitches[j] != next_pitches[j] or current_pitches[k] != next_pitches[k]:
-                            errors.append({
-                                'type': 'parallel_unisons',
-                                'location': f'Chords {chord_num}-{chord_num + 1}',
-                                'voice': f'{voice_names[j]} and {voice_names[k]}',
-                                'description': f'Parallel unisons between {voice_names[j]} and {voice_names[k]}',
-                                'severity': 'error'
-                            })
-                            suggestions.append(f'Separate {voice_names[j]} and {voice_names[k]} to different pitches')
-            
-            # Check for voice crossing
-            for j in range(3):
-                if current_pitches[j] > current_pitches[j + 1]:
+                    suggestions[f'Change chord voicing or try different chord progression at position {chord_num}'] = None
+                
+                # Parallel unisons (same note repeated in different voices)
+                if parallel_unisons[i, pair]:
                     errors.append({
-                        'type': 'voice_crossing',
-                        'location': f'Chord {chord_num}',
-                        'voice': f'{voice_names[j]} and {voice_names[j + 1]}',
-                        'description': f'{voice_names[j]} crosses above {voice_names[j + 1]}',
+                        'type': 'parallel_unisons',
+                        'location': f'Chords {chord_num}-{chord_num + 1}',
+                        'voice': f'{voice_names[j]} and {voice_names[k]}',
+                        'description': f'Parallel unisons between {voice_names[j]} and {voice_names[k]}',
                         'severity': 'error'
                     })
-                    suggestions.append(f'Reorder voices: {voice_names[j + 1]} should be higher than {voice_names[j]}')
+                    suggestions[f'Separate {voice_names[j]} and {voice_names[k]} to different pitches'] = None
+            
+            # Check for voice crossing
+            for j in np.flatnonzero(crossings[i]):
+                errors.append({
+                    'type': 'voice_crossing',
+                    'location': f'Chord {chord_num}',
+                    'voice': f'{voice_names[j]} and {voice_names[j + 1]}',
+                    'description': f'{voice_names[j]} crosses above {voice_names[j + 1]}',
+                    'severity': 'error'
+                })
+                suggestions[f'Reorder voices: {voice_names[j + 1]} should be higher than {voice_names[j]}'] = None
             
             # Check for incomplete chords
-            current_pitch_classes = set(p.pitchClass for p in current_pitches)
+            # Pitch classes present, as a 12-bit mask
+            pc_mask = 0
+            for p in current_pitches:
+                pc_mask |= 1 << p.pitchClass
             
             # For major/minor triads, we need root, third, and fifth
-            if len(current_pitch_classes) < 3:
+            if pc_mask.bit_count() < 3:
                 missing_tones = []
                 root_pc = current_chord.root().pitchClass if current_chord.root() else None
                 third_pc = current_chord.third.pitchClass if current_chord.third else None
                 fifth_pc = current_chord.fifth.pitchClass if current_chord.fifth else None
                 
-                if root_pc and root_pc not in current_pitch_classes:
+                if root_pc and not pc_mask >> root_pc & 1:
                     missing_tones.append('root')
-                if third_pc and third_pc not in current_pitch_classes:
+                if third_pc and not pc_mask >> third_pc & 1:
                     missing_tones.append('third')
-                if fifth_pc and fifth_pc not in current_pitch_classes:
+                if fifth_pc and not pc_mask >> fifth_pc & 1:
                     missing_tones.append('fifth')
                 
                 if missing_tones:
@@ -1049,24 +1417,22 @@ def validate_satb_rules(satb_data, chord_progression, key_name, compromises=None
                         'description': f'Incomplete chord: missing {", ".join(missing_tones)}',
                         'severity': 'error'
                     })
-                    suggestions.append(f'Include all chord tones (root, third, fifth) in chord {chord_num}')
+                    suggestions[f'Include all chord tones (root, third, fifth) in chord {chord_num}'] = None
             
             # Check for large melodic leaps
-            for j, voice_name in enumerate(voice_names):
-                leap = abs(current_pitches[j].midi - next_pitches[j].midi)
-                max_leap = 12 if j == 0 else 6  # Bass can leap up to octave, others max 6th
-                
-                if leap > max_leap:
-                    severity = 'error' if leap > 12 else 'warning'
-                    errors.append({
-                        'type': 'large_leap',
-                        'location': f'Chords {chord_num}-{chord_num + 1}',
-                        'voice': voice_name,
-                        'description': f'{voice_name} leaps {leap} semitones (>{max_leap} limit)',
-                        'severity': severity
-                    })
-                    if severity == 'error':
-                        suggestions.append(f'Reduce {voice_name} leap by changing chord voicing or progression')
+            for j in np.flatnonzero(large_leaps[i]):
+                voice_name = voice_names[j]
+                leap = leaps[i, j]
+                severity = 'error' if leap > 12 else 'warning'
+                errors.append({
+                    'type': 'large_leap',
+                    'location': f'Chords {chord_num}-{chord_num + 1}',
+                    'voice': voice_name,
+                    'description': f'{voice_name} leaps {leap} semitones (>{MAX_LEAPS[j]} limit)',
+                    'severity': severity
+                })
+                if severity == 'error':
+                    suggestions[f'Reduce {voice_name} leap by changing chord voicing or progression'] = None
             
             # Check for proper resolution of tendency tones
             if i < len(chord_progression) - 1:
@@ -1075,26 +1441,18 @@ def validate_satb_rules(satb_data, chord_progression, key_name, compromises=None
                 
                 # Leading tone resolution
                 if 'V' in current_roman and ('I' in next_roman or 'i' in next_roman):
-                    leading_tone = key_obj.getLeadingTone()
-                    tonic = key_obj.getTonic()
-                    
-                    # Find leading tone in current chord
-                    for j, p in enumerate(current_pitches):
-                        if p.name == leading_tone.name:
-                            next_p = next_pitches[j]
-                            if next_p.name != tonic.name:
-                                warnings.append({
-                                    'type': 'tendency_tone',
-                                    'location': f'Chords {chord_num}-{chord_num + 1}',
-                                    'voice': voice_names[j],
-                                    'description': f'Leading tone in {voice_names[j]} should resolve to tonic',
-                                    'severity': 'warning'
-                                })
-                                suggestions.append(f'Resolve leading tone in {voice_names[j]} upward to tonic')
+                    for j in np.flatnonzero(unresolved_leading_tones[i]):
+                        warnings.append({
+                            'type': 'tendency_tone',
+                            'location': f'Chords {chord_num}-{chord_num + 1}',
+                            'voice': voice_names[j],
+                            'description': f'Leading tone in {voice_names[j]} should resolve to tonic',
+                            'severity': 'warning'
+                        })
+                        suggestions[f'Resolve leading tone in {voice_names[j]} upward to tonic'] = None
             
             # Check chord spacing
-            soprano_alto = current_pitches[3].midi - current_pitches[2].midi
-            alto_tenor = current_pitches[2].midi - current_pitches[1].midi
+            alto_tenor, soprano_alto = spacing[i, 1:]
             
             if soprano_alto > 12:  # More than an octave
                 warnings.append({
@@ -1104,7 +1462,7 @@ def validate_satb_rules(satb_data, chord_progression, key_name, compromises=None
                     'description': f'Wide spacing between Soprano and Alto ({soprano_alto} semitones)',
                     'severity': 'warning'
                 })
-                suggestions.append('Keep upper voices within an octave of each other')
+                suggestions['Keep upper voices within an octave of each other'] = None
             
             if alto_tenor > 12:  # More than an octave
                 warnings.append({
@@ -1114,7 +1472,7 @@ def validate_satb_rules(satb_data, chord_progression, key_name, compromises=None
                     'description': f'Wide spacing between Alto and Tenor ({alto_tenor} semitones)',
                     'severity': 'warning'
                 })
-                suggestions.append('Keep upper voices within an octave of each other')
+                suggestions['Keep upper voices within an octave of each other'] = None
         
         # Calculate overall score including compromises
         error_count = len([e for e in errors if e['severity'] == 'error'])
@@ -1134,18 +1492,19 @@ def validate_satb_rules(satb_data, chord_progression, key_name, compromises=None
         score = max(0, 100 - (error_count * 20) - (warning_count * 5) - compromise_penalty)
         
         # Add summary suggestions
+        summary = []
         if error_count > 0:
-            suggestions.insert(0, f'Found {error_count} serious errors - consider trying a different chord progression')
+            summary.append(f'Found {error_count} serious errors - consider trying a different chord progression')
         elif warning_count > 2:
-            suggestions.insert(0, f'Found {warning_count} minor issues - harmonization could be improved')
+            summary.append(f'Found {warning_count} minor issues - harmonization could be improved')
         elif error_count == 0 and warning_count <= 1:
-            suggestions.insert(0, 'Good SATB writing! Minor or no issues found.')
+            summary.append('Good SATB writing! Minor or no issues found.')
         
         return {
             'errors': errors,
             'warnings': warnings,
             'score': score,
-            'suggestions': list(set(suggestions))  # Remove duplicates
+            'suggestions': summary + list(suggestions)
         }
         
     except Exception as e:
@@ -1156,6 +1515,158 @@ def validate_satb_rules(satb_data, chord_progression, key_name, compromises=None
             'suggestions': ['Try generating a new harmonization']
         }
 
+# Replicate API key - try multiple possible environment variable names
+REPLICATE_API_TOKEN = (os.environ.get('REPLICATE_API_KEY') or
+                       os.environ.get('REPLICATE_API_TOKEN') or
+                       os.environ.get('REPLICATE_TOKEN'))
+if not REPLICATE_API_TOKEN:
+    print("Warning: no Replicate API key configured; /generate_ai_music will be unavailable")
+
+# One client for the life of the process, over a keep-alive HTTP/2 connection
+# pool, so creating and polling predictions skips the TCP and TLS handshakes
+_replicate_client = replicate.Client(
+    api_token=REPLICATE_API_TOKEN,
+    transport=httpx.HTTPTransport(
+        http2=True,
+        limits=httpx.Limits(max_keepalive_connections=10, keepalive_expiry=60)
+    )
+)
+
+# Public base URL of this service and the signing secret of the account's webhooks
+# (whsec_..., from GET /v1/webhooks/default/secret). With both set, Replicate calls
+# /replicate_webhook as soon as a prediction completes instead of us polling for it.
+PUBLIC_URL = os.environ.get('PUBLIC_URL', '').rstrip('/')
+REPLICATE_WEBHOOK_SECRET = os.environ.get('REPLICATE_WEBHOOK_SECRET', '')
+USE_WEBHOOKS = bool(PUBLIC_URL and REPLICATE_WEBHOOK_SECRET)
+if PUBLIC_URL and not REPLICATE_WEBHOOK_SECRET:
+    print("Warning: PUBLIC_URL is set without REPLICATE_WEBHOOK_SECRET; polling Replicate instead of using webhooks")
+
+# Webhooks older than this many seconds are rejected, so ids seen within it are all we
+# need to remember to refuse replays
+WEBHOOK_TOLERANCE = 300
+_processed_webhooks = {}  # webhook-id -> time received
+
+MUSICGEN_MODEL = "meta/musicgen:671ac645ce5e552cc63a54a2bbff63fcf798043055d2dac5fc9e36a837eedcfb"
+MUSICGEN_PROMPT = ("A beautiful instrumental piece in {key} with the chord progression: {progression}. "
+                   "The piece should be melodic, harmonious, and suitable for background music. Duration: 30 seconds.")
+MUSICGEN_VERSION = MUSICGEN_MODEL.split(':')[1]
+# Whitespace- and case-insensitive form of the template, as it goes into cache keys
+MUSICGEN_PROMPT_KEY = ' '.join(MUSICGEN_PROMPT.lower().split())
+# Everything sent to MusicGen besides the prompt
+MUSICGEN_SETTINGS = {
+    "duration": 30,  # Increased to 30 seconds for better musical pieces
+    "temperature": 1.0,
+    "continuation": False,
+    "model_version": "stereo-large",
+    "output_format": "mp3",
+    "normalization_strategy": "peak",
+    "top_k": 250,
+    "top_p": 0.0,
+    "classifier_free_guidance": 3.0
+}
+
+# On-disk cache of MusicGen results, keyed by a SHA-256 of the generation inputs
+AUDIO_CACHE_DIR = os.environ.get('AUDIO_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'musicgen_cache'))
+AUDIO_CACHE_MAX_BYTES = int(os.environ.get('AUDIO_CACHE_MAX_BYTES', 10 * 1024 * 1024))
+AUDIO_CACHE_TTL = int(os.environ.get('AUDIO_CACHE_TTL', 3600))  # Replicate output URLs expire
+
+# Caps concurrent Replicate calls across the worker's request threads to stay under rate limits
+REPLICATE_CONCURRENCY = int(os.environ.get('REPLICATE_CONCURRENCY', 8))
+_replicate_slots = threading.BoundedSemaphore(REPLICATE_CONCURRENCY)
+
+def _canonical_key_name(key_signature):
+    """Tonic pitch class and mode of a key name, so 'Db major' and ' c#  Major' match."""
+    parts = key_signature.split()
+    try:
+        tonic = pitch.Pitch(parts[0]).pitchClass
+    except (IndexError, pitch.PitchException):
+        return ' '.join(parts).lower()
+    mode = parts[1].lower() if len(parts) > 1 else 'major'
+    return f'{tonic} {mode}'
+
+def _cache_key(chord_progression, key_signature, model_version, duration, top_k, top_p, cfg, temperature):
+    """Hash the inputs that determine a MusicGen result into a stable hex key.
+    
+    Inputs are canonicalized first so trivially different requests share an
+    entry. The prompt is built from MUSICGEN_PROMPT, so the template stands in
+    for it and changing the template invalidates old entries.
+    """
+    payload = {
+        'model': MUSICGEN_MODEL,
+        'prompt_template': MUSICGEN_PROMPT_KEY,
+        'chord_progression': [unicodedata.normalize('NFC', str(numeral)).strip() for numeral in chord_progression],
+        'key': _canonical_key_name(key_signature),
+        'model_version': model_version,
+        'duration': duration,
+        'top_k': top_k,
+        'top_p': round(top_p, 3),
+        'classifier_free_guidance': round(cfg, 3),
+        'temperature': round(temperature, 3),
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, separators=(',', ':')).encode()).hexdigest()
+
+def _cache_path(cache_key):
+    return os.path.join(AUDIO_CACHE_DIR, cache_key + '.json')
+
+# Running /generate_ai_music cache hit rate, so misses from key drift show up in the logs
+_audio_cache_lookups = {'hits': 0, 'misses': 0}
+
+def record_audio_cache_lookup(hit):
+    """Count a cache lookup and log the running hit rate."""
+    _audio_cache_lookups['hits' if hit else 'misses'] += 1
+    total = _audio_cache_lookups['hits'] + _audio_cache_lookups['misses']
+    print(f"Audio cache {'hit' if hit else 'miss'} ({_audio_cache_lookups['hits'] / total:.0%} of {total} lookups hit)")
+
+def get_cached_audio_url(cache_key):
+    """Return the cached audio URL for this key, or None if missing or expired.
+    
+    Read from disk every time, so every worker sees other workers' writes and
+    evictions, and every hit refreshes the entry's access time for eviction.
+    """
+    path = _cache_path(cache_key)
+    try:
+        with open(path) as f:
+            entry = json.load(f)
+        os.utime(path)  # Mark as recently used for eviction
+    except (OSError, ValueError):
+        return None
+    if time.time() - entry['created'] > AUDIO_CACHE_TTL:
+        return None
+    return entry['audio_url']
+
+def store_cached_audio_url(cache_key, audio_url):
+    """Persist a generated audio URL and evict old entries if the cache is over its cap."""
+    try:
+        os.makedirs(AUDIO_CACHE_DIR, exist_ok=True)
+        path = _cache_path(cache_key)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'audio_url': audio_url, 'created': time.time()}, f)
+        os.replace(tmp_path, path)
+        evict_audio_cache()
+    except OSError as e:
+        print(f"Could not write audio cache entry: {e}")
+
+def evict_audio_cache():
+    """Delete least-recently-used entries until the cache directory fits AUDIO_CACHE_MAX_BYTES."""
+    entries = []
+    total_size = 0
+    for entry in os.scandir(AUDIO_CACHE_DIR):
+        if entry.is_file() and entry.name.endswith('.json'):
+            st = entry.stat()
+            entries.append((st.st_atime, st.st_size, entry.path))
+            total_size += st.st_size
+    if total_size <= AUDIO_CACHE_MAX_BYTES:
+        return
+    for _, size, path in sorted(entries):
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total_size -= size
+        if total_size <= AUDIO_CACHE_MAX_BYTES:
+            break
+
 @app.route('/generate_ai_music', methods=['POST'])
 def generate_ai_music():
     """Generate AI music based on chord progression using Replicate API."""
@@ -1167,57 +1678,305 @@ def generate_ai_music():
         if not chord_progression:
             return jsonify({'error': 'No chord progression provided'}), 400
         
-        # Set up Replicate API key - try multiple possible environment variable names
-        api_key = (os.environ.get('REPLICATE_API_KEY') or 
-                  os.environ.get('REPLICATE_API_TOKEN') or
-                  os.environ.get('REPLICATE_TOKEN'))
-        
-        if not api_key:
-            print(f"Available environment variables: {list(os.environ.keys())}")
-            return jsonify({'error': 'Replicate API key not configured'}), 500
-        
-        # Set the API key for replicate
-        os.environ['REPLICATE_API_TOKEN'] = api_key
-        
         # Create a descriptive prompt for the AI
-        progression_text = ' - '.join(chord_progression)
-        prompt = f"A beautiful instrumental piece in {key_signature} with the chord progression: {progression_text}. The piece should be melodic, harmonious, and suitable for background music. Duration: 30 seconds."
+        prompt = MUSICGEN_PROMPT.format(key=key_signature, progression=' - '.join(chord_progression))
         
-        # Use MusicGen model for music generation
-        output = replicate.run(
-            "meta/musicgen:671ac645ce5e552cc63a54a2bbff63fcf798043055d2dac5fc9e36a837eedcfb",
-            input={
-                "prompt": prompt,
-                "duration": 30,  # Increased to 30 seconds for better musical pieces
-                "temperature": 1.0,
-                "continuation": False,
-                "model_version": "stereo-large",
-                "output_format": "mp3",
-                "normalization_strategy": "peak",
-                "top_k": 250,
-                "top_p": 0.0,
-                "classifier_free_guidance": 3.0
-            }
-        )
+        musicgen_input = {"prompt": prompt, **MUSICGEN_SETTINGS}
         
-        if output:
-            # Convert FileOutput to string URL
-            audio_url = str(output)
-            
+        # Identical requests reuse the previous result instead of calling Replicate again,
+        # unless the client asks for a fresh piece with ?cache=0
+        cache_key = _cache_key(
+            chord_progression, key_signature,
+            musicgen_input['model_version'], musicgen_input['duration'],
+            musicgen_input['top_k'], musicgen_input['top_p'],
+            musicgen_input['classifier_free_guidance'], musicgen_input['temperature']
+        )
+        use_cache = request.args.get('cache', '1').lower() not in ('0', 'false', 'no')
+        audio_url = None
+        if use_cache:
+            audio_url = get_cached_audio_url(cache_key)
+            record_audio_cache_lookup(audio_url is not None)
+        if audio_url:
             return jsonify({
                 'success': True,
                 'audio_url': audio_url,
                 'prompt': prompt,
                 'chord_progression': chord_progression,
-                'key': key_signature
+                'key': key_signature,
+                'status': 'done',
+                'cached': True
             })
-        else:
-            return jsonify({'error': 'No audio generated'}), 500
+        
+        if not REPLICATE_API_TOKEN:
+            return jsonify({'error': 'Replicate API key not configured'}), 500
+        
+        # Start the prediction without waiting for it; the client listens on /jobs/<job_id>/stream
+        # (or polls /jobs/<job_id>).
+        job_id = start_music_job(cache_key, prompt, musicgen_input, chord_progression, key_signature, use_cache)
+        
+        job = _music_jobs[job_id]
+        status_url = f'/jobs/{job_id}'
+        response = jsonify({
+            'success': True,
+            'job_id': job_id,
+            'status': 'queued',
+            'status_url': status_url,
+            'stream_url': f'{status_url}/stream',
+            'prompt': job['prompt'],
+            'chord_progression': job['chord_progression'],
+            'key': job['key']
+        })
+        return response, 202, {'Location': status_url}
             
     except Exception as e:
         print(f"Error generating AI music: {str(e)}")
         return jsonify({'error': f'Error generating music: {str(e)}'}), 500
 
+# Pending and finished MusicGen jobs, keyed by Replicate prediction id. Jobs live in
+# this process, which is fine for the single gunicorn worker we deploy with.
+_music_jobs = {}
+_music_jobs_lock = threading.Lock()
+# Predictions being created, by cache key. Identical requests that arrive meanwhile wait
+# for that one instead of starting their own; requests for anything else do not wait.
+_music_job_creations = {}
+# Signalled whenever a job reaches a final state, waking /jobs/<job_id>/stream listeners
+_music_jobs_changed = threading.Condition(_music_jobs_lock)
+
+# How long an event stream stays open, and how often it checks Replicate itself in case no
+# webhook arrives (rarely when webhooks are on, every couple of seconds when they are not)
+JOB_STREAM_TIMEOUT = 300
+JOB_STREAM_POLL_INTERVAL = 15 if USE_WEBHOOKS else 2
+# Each open stream holds one of the worker's request threads (8 with the shipped gunicorn
+# settings), so only this many are allowed; further clients get a 503 and poll instead
+MAX_JOB_STREAMS = int(os.environ.get('MAX_JOB_STREAMS', 4))
+_job_stream_slots = threading.BoundedSemaphore(MAX_JOB_STREAMS)
+# However many clients poll or stream a job, Replicate is asked about it at most this often
+JOB_REFRESH_INTERVAL = 1
+
+# Replicate prediction states mapped onto the states reported to clients
+PREDICTION_STATUS = {
+    'starting': 'queued',
+    'processing': 'running',
+    'succeeded': 'done',
+    'failed': 'failed',
+    'canceled': 'failed'
+}
+
+def register_music_job(job_id, cache_key, prompt, chord_progression, key_signature, use_cache=True):
+    """Remember a started MusicGen job and forget ones older than the audio cache TTL."""
+    now = time.time()
+    job = {
+        'cache_key': cache_key,
+        'use_cache': use_cache,  # False when regenerating, so the old cached result is not picked up
+        'prompt': prompt,
+        'chord_progression': chord_progression,
+        'key': key_signature,
+        'created': now,
+        'checked': 0,  # When Replicate was last asked about this job
+        'status': 'queued',
+        'audio_url': None,
+        'error': None
+    }
+    with _music_jobs_lock:
+        for old_id in [j for j, old in _music_jobs.items() if now - old['created'] > AUDIO_CACHE_TTL]:
+            del _music_jobs[old_id]
+        _music_jobs[job_id] = job
+    return job
+
+def find_pending_music_job(cache_key):
+    """Return the id of a job for these inputs that is still in flight, or None if there is none.
+    
+    Finished jobs are left out: their result is in the audio cache, and a ?cache=0
+    request must start a new prediction rather than get the old piece back.
+    """
+    now = time.time()
+    with _music_jobs_lock:
+        for job_id, job in _music_jobs.items():
+            if job['cache_key'] == cache_key and job['status'] not in ('done', 'failed') and \
+               now - job['created'] <= AUDIO_CACHE_TTL:
+                return job_id
+    return None
+
+def start_music_job(cache_key, prompt, musicgen_input, chord_progression, key_signature, use_cache=True):
+    """Return the id of a job for these inputs, starting a Replicate prediction unless one is in flight."""
+    with _music_jobs_lock:
+        creation = _music_job_creations.get(cache_key)
+        starting = creation is None
+        if starting:
+            creation = _music_job_creations[cache_key] = {'ready': threading.Event(), 'job_id': None}
+    if not starting:
+        creation['ready'].wait()
+        if creation['job_id'] is None:
+            raise RuntimeError('Could not start the prediction')
+        return creation['job_id']
+    
+    # Only this request creates the prediction, and the network call happens outside
+    # the jobs lock so requests for other inputs go ahead in parallel
+    try:
+        job_id = find_pending_music_job(cache_key)
+        if job_id is None:
+            webhook_args = {}
+            if USE_WEBHOOKS:
+                webhook_args = {
+                    'webhook': f'{PUBLIC_URL}/replicate_webhook',
+                    'webhook_events_filter': ['completed']
+                }
+            with _replicate_slots:
+                prediction = _replicate_client.predictions.create(
+                    version=MUSICGEN_VERSION,
+                    input=musicgen_input,
+                    **webhook_args
+                )
+            job_id = prediction.id
+            register_music_job(job_id, cache_key, prompt, chord_progression, key_signature, use_cache)
+        creation['job_id'] = job_id
+        return job_id
+    finally:
+        with _music_jobs_lock:
+            del _music_job_creations[cache_key]
+        creation['ready'].set()
+
+def update_music_job(job, prediction_status, output=None, error=None):
+    """Apply a Replicate prediction state to a job and wake any streams waiting on it."""
+    status = PREDICTION_STATUS.get(prediction_status, 'running')
+    if status == 'done' and not output:
+        status, error = 'failed', 'No audio generated'
+    if status == 'done' and job['audio_url'] is None:
+        store_cached_audio_url(job['cache_key'], str(output))
+    with _music_jobs_changed:
+        job['status'] = status
+        if status == 'done':
+            job['audio_url'] = str(output)
+        elif status == 'failed':
+            job['error'] = error or 'Music generation failed'
+        _music_jobs_changed.notify_all()
+
+def refresh_music_job(job_id, job):
+    """Bring an unfinished job up to date from the audio cache or, failing that, from Replicate."""
+    if job['status'] in ('done', 'failed'):
+        return
+    audio_url = get_cached_audio_url(job['cache_key']) if job['use_cache'] else None
+    if audio_url:
+        job['audio_url'] = audio_url
+        update_music_job(job, 'succeeded', audio_url)
+        return
+    now = time.time()
+    if now - job['checked'] < JOB_REFRESH_INTERVAL:
+        return
+    job['checked'] = now
+    with _replicate_slots:
+        prediction = _replicate_client.predictions.get(job_id)
+    update_music_job(job, prediction.status, prediction.output, prediction.error)
+
+def music_job_result(job_id, job):
+    """Build the client-facing view of a job."""
+    result = {
+        'success': job['status'] != 'failed',
+        'job_id': job_id,
+        'status': job['status'],
+        'prompt': job['prompt'],
+        'chord_progression': job['chord_progression'],
+        'key': job['key']
+    }
+    if job['status'] == 'done':
+        result['audio_url'] = job['audio_url']
+    elif job['status'] == 'failed':
+        result['error'] = job['error']
+    return result
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_music_job(job_id):
+    """Report the status of a MusicGen job, including the audio URL once it is done."""
+    job = _music_jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    
+    try:
+        refresh_music_job(job_id, job)
+    except Exception as e:
+        print(f"Error checking AI music job {job_id}: {str(e)}")
+        return jsonify({'error': f'Error checking job: {str(e)}'}), 502
+    return jsonify(music_job_result(job_id, job))
+
+@app.route('/jobs/<job_id>/stream', methods=['GET'])
+def stream_music_job(job_id):
+    """Push a MusicGen job's result to the client as a Server-Sent Event once it finishes."""
+    job = _music_jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    if not _job_stream_slots.acquire(blocking=False):
+        return jsonify({'error': 'Too many open streams; poll the status URL instead'}), 503, \
+            {'Retry-After': str(JOB_STREAM_POLL_INTERVAL)}
+    
+    def events():
+        deadline = time.time() + JOB_STREAM_TIMEOUT
+        while True:
+            with _music_jobs_changed:
+                _music_jobs_changed.wait_for(lambda: job['status'] in ('done', 'failed'),
+                                             timeout=JOB_STREAM_POLL_INTERVAL)
+            try:
+                refresh_music_job(job_id, job)  # Covers a missed or unconfigured webhook
+            except Exception as e:
+                print(f"Error checking AI music job {job_id}: {str(e)}")
+            if job['status'] in ('done', 'failed'):
+                yield f"data: {json.dumps(music_job_result(job_id, job))}\n\n"
+                return
+            if time.time() > deadline:
+                yield 'event: timeout\ndata: {}\n\n'
+                return
+            yield ': keep-alive\n\n'
+    
+    response = Response(events(), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    # Runs when the stream ends or the client goes away, even if it never started
+    response.call_on_close(_job_stream_slots.release)
+    return response
+
+def verify_replicate_webhook(headers, body):
+    """Check a webhook's signature and timestamp (Replicate signs them per Standard Webhooks)."""
+    webhook_id = headers.get('webhook-id', '')
+    timestamp = headers.get('webhook-timestamp', '')
+    if not (REPLICATE_WEBHOOK_SECRET and webhook_id and timestamp.isdigit()):
+        return False
+    if abs(time.time() - int(timestamp)) > WEBHOOK_TOLERANCE:
+        return False
+    try:
+        secret = base64.b64decode(REPLICATE_WEBHOOK_SECRET.split('_', 1)[-1])
+    except ValueError:
+        return False
+    signed = f'{webhook_id}.{timestamp}.'.encode() + body
+    expected = base64.b64encode(hmac.new(secret, signed, hashlib.sha256).digest()).decode()
+    # The header holds space-separated "v1,<signature>" entries, one per active secret
+    return any(hmac.compare_digest(expected, entry.split(',', 1)[-1])
+               for entry in headers.get('webhook-signature', '').split())
+
+@app.route('/replicate_webhook', methods=['POST'])
+def replicate_webhook():
+    """Receive Replicate's completion callback and hand the result to waiting streams."""
+    body = request.get_data()
+    if not verify_replicate_webhook(request.headers, body):
+        return jsonify({'error': 'Invalid webhook signature'}), 401
+    
+    webhook_id = request.headers['webhook-id']
+    now = time.time()
+    with _music_jobs_lock:
+        for old_id in [w for w, seen in _processed_webhooks.items() if now - seen > WEBHOOK_TOLERANCE]:
+            del _processed_webhooks[old_id]
+        if webhook_id in _processed_webhooks:
+            return '', 204  # Replayed or retried delivery we already handled
+        _processed_webhooks[webhook_id] = now
+    
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        return jsonify({'error': 'Invalid JSON'}), 400
+    if not isinstance(payload, dict):
+        return jsonify({'error': 'Expected a JSON object'}), 400
+    job = _music_jobs.get(payload.get('id'))
+    if job is not None:
+        update_music_job(job, payload.get('status'), payload.get('output'), payload.get('error'))
+    return '', 204
+
 if __name__ == '__main__':
     # Use environment variable for port (for deployment) or default to 8080
     port = int(os.environ.get('PORT', 8080))